@@ -0,0 +1,266 @@
+import numpy as np
+
+from AzulRules import BOARD_SIZE, FULL_LINE, get_rules
+
+RULES = get_rules('pattern')
+NUM_COLORS = len(RULES.colors)
+NUM_LINES = BOARD_SIZE
+
+# WALL_COLS[row, color] is the wall column of that color in the row
+WALL_COLS = np.array(RULES.wall_cols)
+# Wall bit of (row, color), in the same layout as Player.wall_mask and its transpose
+CELL_BITS = np.array([[1 << (row * 5 + WALL_COLS[row, color]) for color in range(NUM_COLORS)] for row in range(NUM_LINES)], dtype=np.int64)
+CELL_BITS_T = np.array([[1 << (WALL_COLS[row, color] * 5 + row) for color in range(NUM_COLORS)] for row in range(NUM_LINES)], dtype=np.int64)
+
+RUNS = np.array(RULES.row_runs)
+CAPACITY = np.arange(1, NUM_LINES + 1, dtype=np.int8)
+FLOOR_PENALTY = np.array(RULES.floor_penalty)
+
+
+def fold(ufunc, array):
+    # Reduces the last axis. NumPy's reductions over axes this short are
+    # several times slower than folding the slices elementwise.
+    result = array[..., 0]
+    for i in range(1, array.shape[-1]):
+        result = ufunc(result, array[..., i])
+    return result
+
+
+class AzulBatch:
+    """Pattern-mode Azul for many games at once, advanced in lockstep.
+
+    All state is held in NumPy arrays with the game as first axis. Sources
+    are stored as one (games, factories + 1, colors) count array whose last
+    entry is the center, matching the factories + [center] order used by
+    AzulCPU. Walls use the same 25-bit masks as Player.
+    """
+
+    def __init__(self, num_games, num_players=2, policies=("dummy", "dummy"), seed=None):
+        self.num_games = num_games
+        self.num_players = num_players
+        self.num_factories = RULES.factory_count(num_players)
+        self.policies = [POLICIES[policy] if isinstance(policy, str) else policy for policy in policies]
+        self.rng = np.random.default_rng(seed)
+        # The policies' own choices come from a second stream, so they leave the tile draws alone
+        self.policy_rng = np.random.default_rng(None if seed is None else [seed, 1])
+
+        games, players = num_games, num_players
+        self.sources = np.zeros((games, self.num_factories + 1, NUM_COLORS), dtype=np.int8)
+        self.center_token = np.zeros(games, dtype=bool)
+        self.pattern_colors = np.full((games, players, NUM_LINES), -1, dtype=np.int8)
+        self.pattern_counts = np.zeros((games, players, NUM_LINES), dtype=np.int8)
+        self.walls = np.zeros((games, players), dtype=np.int64)
+        self.walls_t = np.zeros((games, players), dtype=np.int64)
+        # on_wall[game, player, color, row] is set once the color is tiled in that row
+        self.on_wall = np.zeros((games, players, NUM_COLORS, NUM_LINES), dtype=bool)
+        self.floor_counts = np.zeros((games, players, NUM_COLORS), dtype=np.int8)
+        self.floor_token = np.zeros((games, players), dtype=bool)
+        self.scores = np.zeros((games, players), dtype=np.int32)
+        self.bag = np.tile(np.array(RULES.bag, dtype=np.int8), (games, 1))
+        self.discard = np.zeros((games, NUM_COLORS), dtype=np.int8)
+
+        self.active_player = np.zeros(games, dtype=np.int64)
+        self.first_player_token = np.zeros(games, dtype=np.int64)
+        self.round_num = np.ones(games, dtype=np.int64)
+        self.done = np.zeros(games, dtype=bool)
+
+        self.fill_factories(np.arange(games))
+
+    def reset(self, idx):
+        # Starts the games idx over with a full bag and fresh factories
+        self.pattern_colors[idx] = -1
+        self.pattern_counts[idx] = 0
+        self.walls[idx] = 0
+        self.walls_t[idx] = 0
+        self.on_wall[idx] = False
+        self.floor_counts[idx] = 0
+        self.floor_token[idx] = False
+        self.scores[idx] = 0
+        self.bag[idx] = RULES.bag
+        self.discard[idx] = 0
+        self.active_player[idx] = 0
+        self.first_player_token[idx] = 0
+        self.round_num[idx] = 1
+        self.done[idx] = False
+        self.fill_factories(idx)
+
+    def fill_factories(self, idx):
+        bag = self.bag[idx]
+        sources = np.zeros((len(idx),) + self.sources.shape[1:], dtype=self.sources.dtype)
+        remaining = fold(np.add, bag)
+        for factory in range(self.num_factories):
+            for _ in range(RULES.tiles_per_factory):
+                drawing = np.nonzero(remaining > 0)[0]
+                pick = (self.rng.random(len(drawing)) * remaining[drawing]).astype(np.int64)
+                color = (bag[drawing].cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+                bag[drawing, color] -= 1
+                sources[drawing, factory, color] += 1
+                remaining[drawing] -= 1
+
+        self.bag[idx] = bag
+        self.sources[idx] = sources
+        self.center_token[idx] = True
+
+    def valid_lines(self, idx, player):
+        # (games, colors, lines) mask matching AzulGame.get_valid_lines
+        counts = self.pattern_counts[idx, player][:, None, :]
+        colors = self.pattern_colors[idx, player][:, None, :]
+        open_line = (counts == 0) | ((colors == np.arange(NUM_COLORS)[:, None]) & (counts < CAPACITY))
+        return open_line & ~self.on_wall[idx, player]
+
+    def valid_lines_for(self, idx, player, color):
+        # (games, lines) mask of valid lines for one color per game
+        counts = self.pattern_counts[idx, player]
+        open_line = (counts == 0) | ((self.pattern_colors[idx, player] == color[:, None]) & (counts < CAPACITY))
+        return open_line & ~self.on_wall[idx, player, color]
+
+    def legal_moves(self, idx):
+        # (games, sources, colors, lines + floor) mask for the active players, floor last
+        available = self.sources[idx] > 0
+        lines = np.ones((len(idx), NUM_COLORS, NUM_LINES + 1), dtype=bool)
+        lines[:, :, :NUM_LINES] = self.valid_lines(idx, self.active_player[idx])
+        return available[:, :, :, None] & lines[:, None]
+
+    def round_over(self):
+        factories_left = fold(np.logical_or, self.sources[:, :self.num_factories].reshape(self.num_games, -1))
+        center_size = fold(np.add, self.sources[:, self.num_factories]) + self.center_token
+        center_valid = (center_size > 2) | ((center_size == 1) & ~self.center_token)
+        return ~self.done & ~factories_left & ~center_valid
+
+    def take_tiles(self, idx, player, source, color, line):
+        taken = self.sources[idx, source, color]
+        self.sources[idx, source, color] = 0
+
+        # Move leftover tiles to center
+        from_factory = source < self.num_factories
+        rows, factories = idx[from_factory], source[from_factory]
+        self.sources[rows, self.num_factories] += self.sources[rows, factories]
+        self.sources[rows, factories] = 0
+
+        # Handle first player token
+        token = ~from_factory & self.center_token[idx]
+        rows = idx[token]
+        self.center_token[rows] = False
+        self.first_player_token[rows] = player[token]
+        self.floor_token[rows, player[token]] = True
+
+        # Place tiles
+        to_line = line >= 0
+        rows, players, colors, lines = idx[to_line], player[to_line], color[to_line], line[to_line]
+        placed = np.minimum(taken[to_line], lines + 1 - self.pattern_counts[rows, players, lines])
+        self.pattern_colors[rows, players, lines] = colors
+        self.pattern_counts[rows, players, lines] += placed
+        self.floor_counts[rows, players, colors] += taken[to_line] - placed
+
+        to_floor = ~to_line
+        self.floor_counts[idx[to_floor], player[to_floor], color[to_floor]] += taken[to_floor]
+
+    def move_to_wall(self, idx):
+        for player in range(self.num_players):
+            for row in range(NUM_LINES):
+                rows = idx[self.pattern_counts[idx, player, row] == row + 1]
+                color = self.pattern_colors[rows, player, row].astype(np.int64)
+                col = WALL_COLS[row, color]
+                self.walls[rows, player] |= CELL_BITS[row, color]
+                self.walls_t[rows, player] |= CELL_BITS_T[row, color]
+                self.on_wall[rows, player, color, row] = True
+
+                horizontal = RUNS[self.walls[rows, player] >> (row * 5) & FULL_LINE, col]
+                vertical = RUNS[self.walls_t[rows, player] >> (col * 5) & FULL_LINE, row]
+                self.scores[rows, player] += horizontal + vertical - ((horizontal == 1) | (vertical == 1))
+
+                self.discard[rows, color] += row + 1
+                self.pattern_colors[rows, player, row] = -1
+                self.pattern_counts[rows, player, row] = 0
+
+            floor_size = fold(np.add, self.floor_counts[idx, player]) + self.floor_token[idx, player]
+            points_lost = FLOOR_PENALTY[np.minimum(floor_size, len(FLOOR_PENALTY) - 1)]
+            self.scores[idx, player] = np.maximum(0, self.scores[idx, player] - points_lost)
+            self.discard[idx] += self.floor_counts[idx, player]
+            self.floor_counts[idx, player] = 0
+            self.floor_token[idx, player] = False
+
+    def reset_factories(self, idx):
+        empty = idx[~fold(np.logical_or, self.bag[idx])]
+        self.bag[empty] += self.discard[empty]
+        self.discard[empty] = 0
+        self.fill_factories(idx)
+
+    def has_complete_row(self, idx):
+        rows = self.walls[idx][:, :, None] >> (np.arange(NUM_LINES) * 5) & FULL_LINE
+        return (rows == FULL_LINE).any(axis=(1, 2))
+
+    def end_game_scoring(self, idx):
+        walls = self.walls[idx][:, :, None]
+        shifts = np.arange(NUM_LINES) * 5
+        self.scores[idx] += 2 * ((walls >> shifts & FULL_LINE) == FULL_LINE).sum(axis=2)
+        self.scores[idx] += 7 * ((self.walls_t[idx][:, :, None] >> shifts & FULL_LINE) == FULL_LINE).sum(axis=2)
+        self.scores[idx] += 10 * ((self.walls_t[idx][:, :, None] >> shifts & FULL_LINE) == FULL_LINE).sum(axis=2)
+
+    def step(self):
+        # Every unfinished game takes one turn, then finished rounds are tiled
+        playing = np.nonzero(~self.done)[0]
+        for player in range(self.num_players):
+            idx = playing[self.active_player[playing] == player]
+            if len(idx):
+                source, color, line = self.policies[player](self, idx, player)
+                self.take_tiles(idx, np.full(len(idx), player), source, color, line)
+        self.active_player[playing] = (self.active_player[playing] + 1) % self.num_players
+
+        ended = np.nonzero(self.round_over())[0]
+        if len(ended):
+            self.move_to_wall(ended)
+            finished = ended[self.has_complete_row(ended)]
+            self.end_game_scoring(finished)
+            self.done[finished] = True
+
+            ongoing = ended[~self.done[ended]]
+            self.reset_factories(ongoing)
+            self.round_num[ongoing] += 1
+            self.active_player[ongoing] = self.first_player_token[ongoing]
+
+    def play_games(self):
+        while not self.done.all():
+            self.step()
+        return self.scores
+
+
+def dummy_policy(batch, idx, player):
+    # Vectorized AzulCPU.dummy_algorithm: first source, a color as likely as
+    # its count there, widest valid line
+    sources = batch.sources[idx]
+    games = np.arange(len(idx))
+    source = fold(np.logical_or, sources > 0).argmax(axis=1)
+    counts = sources[games, source]
+    pick = (batch.policy_rng.random(len(idx)) * fold(np.add, counts)).astype(np.int64)
+    color = (counts.cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+    valid = batch.valid_lines_for(idx, player, color)
+    line = np.where(fold(np.logical_or, valid), NUM_LINES - 1 - valid[:, ::-1].argmax(axis=1), -1)
+    return source, color, line
+
+
+def greedy_policy(batch, idx, player):
+    # Vectorized AzulCPU.greedy_algorithm: the first move that fits the most
+    # tiles on a pattern line, else the fewest tiles straight to the floor.
+    # A source and color fits when some valid line has room for all of it,
+    # and the chosen line is the first such line.
+    games = np.arange(len(idx))
+    counts = batch.sources[idx]
+    spaces = np.where(batch.valid_lines(idx, player), CAPACITY - batch.pattern_counts[idx, player][:, None, :], 0)
+    taken = np.where(counts <= fold(np.maximum, spaces)[:, None, :], counts, 0).reshape(len(idx), -1)
+    best = taken.argmax(axis=1)
+    source, color = np.divmod(best, NUM_COLORS)
+    line = (spaces[games, color] >= counts[games, source, color][:, None]).argmax(axis=1)
+
+    overflow = taken[games, best] == 0
+    if overflow.any():
+        floor_counts = np.where(counts[overflow] > 0, counts[overflow], np.iinfo(counts.dtype).max).reshape(int(overflow.sum()), -1)
+        source[overflow], color[overflow] = np.divmod(floor_counts.argmin(axis=1), NUM_COLORS)
+        line[overflow] = -1
+    return source, color, line
+
+
+POLICIES = {
+    "dummy": dummy_policy,
+    "greedy": greedy_policy,
+}
@@ -0,0 +1,214 @@
+import argparse
+import copy
+import json
+import platform
+import sys
+import time
+
+from AzulCPU import AzulCPU
+from AzulEnv import AzulVectorEnv
+from AzulGame import AzulGame
+from AzulState import snapshot
+
+strategies = ["dummy", "greedy", "smart", "strategic"]
+
+
+def timed_rate(run, count, repeats):
+    # Best of several runs, as operations per second
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def new_game(first_strategy, second_strategy, seed, mode='pattern'):
+    game = AzulGame(2, mode=mode, verbose=False, seed=seed)
+    game.ai = [AzulCPU(game, first_strategy), AzulCPU(game, second_strategy)]
+    return game
+
+
+def state_at_round(seed, rounds, finish_round=False):
+    # A reproducible mid-game position: rounds played with strategic CPUs, then
+    # either the start of the next round or its end, right before wall tiling
+    game = new_game("strategic", "strategic", seed)
+    game.setup_game()
+    for _ in range(rounds):
+        game.play_round()
+        game.end_round()
+        game.round_num += 1
+    if finish_round:
+        game.play_round()
+    return game
+
+
+def bench_games(games, repeats):
+    rates = {}
+    for first_strategy in strategies:
+        for second_strategy in strategies:
+            def run():
+                for seed in range(games):
+                    new_game(first_strategy, second_strategy, seed).play_game()
+            rates[f"{first_strategy}-{second_strategy}"] = timed_rate(run, games, repeats)
+    return rates
+
+
+def bench_decisions(positions, repeats):
+    # Decision latency over the positions met along seeded self-play games,
+    # each replayed as a start-of-turn snapshot
+    rates = {}
+    for algorithm in strategies:
+        snapshots = []
+        seed = 0
+        while len(snapshots) < positions:
+            game = new_game(algorithm, algorithm, seed)
+            game.setup_game()
+            while not any(player.has_complete_row() for player in game.players) and len(snapshots) < positions:
+                game.active_player = game.first_player_token
+                while not game.round_over():
+                    snapshots.append(copy.deepcopy(game))
+                    game.play_turn(game.players[game.active_player], is_ai=True)
+                game.end_round()
+                game.round_num += 1
+            seed += 1
+        cpus = [snapshot.ai[snapshot.active_player] for snapshot in snapshots[:positions]]
+
+        def run():
+            for cpu in cpus:
+                cpu.choose_move()
+        rates[algorithm] = timed_rate(run, len(cpus), repeats)
+    return rates
+
+
+def bench_functions(copies, repeats):
+    rates = {}
+
+    game = state_at_round(1, 2)
+    player = game.players[0]
+
+    def run():
+        for _ in range(copies):
+            for color in range(len(game.colors)):
+                game.get_valid_lines(player, color)
+    rates["get_valid_lines"] = timed_rate(run, copies * len(game.colors), repeats)
+
+    def run():
+        for _ in range(copies):
+            snapshot(game)
+    rates["snapshot"] = timed_rate(run, copies, repeats)
+
+    # Functions that change the game run once on each of a set of identical
+    # copies, so every call sees the same position
+    cells = [(row, col) for row in range(5) for col in range(5) if player.row_mask(row) >> col & 1]
+    finished_round = state_at_round(1, 2, finish_round=True)
+    states = []
+
+    def score_tile():
+        for state in states:
+            for row, col in cells:
+                state.score_tile(state.players[0], row, col)
+
+    def end_game_scoring():
+        for state in states:
+            state.end_game_scoring()
+
+    def move_to_wall():
+        for state in states:
+            for state_player in state.players:
+                state.move_to_wall(state_player)
+
+    def reset_factories():
+        for state in states:
+            state.reset_factories()
+
+    for name, base, run, calls in [("score_tile", game, score_tile, copies * len(cells)),
+                                   ("end_game_scoring", game, end_game_scoring, copies),
+                                   ("move_to_wall", finished_round, move_to_wall, copies),
+                                   ("reset_factories", finished_round, reset_factories, copies)]:
+        best = float('inf')
+        for _ in range(repeats):
+            states[:] = [copy.deepcopy(base) for _ in range(copies)]
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        rates[name] = calls / best
+
+    return rates
+
+
+def bench_env(steps, repeats, sizes=(1, 64, 1024)):
+    # Game steps per second of AzulVectorEnv, playing the first legal action
+    # in every game, for each number of games stepped together
+    rates = {}
+    for num_envs in sizes:
+        env = AzulVectorEnv(num_envs, seed=0)
+        calls = max(1, steps // num_envs)
+
+        def run():
+            env.reset(seed=0)
+            for _ in range(calls):
+                env.step(env.masks.argmax(axis=1))
+        rates[str(num_envs)] = timed_rate(run, calls * num_envs, repeats)
+    return rates
+
+
+def run_benchmarks(games=200, positions=2000, copies=2000, repeats=3, env_steps=20000):
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+        },
+        # All metrics are rates, higher is better
+        "games_per_sec": bench_games(games, repeats),
+        "decisions_per_sec": bench_decisions(positions, repeats),
+        "calls_per_sec": bench_functions(copies, repeats),
+        "env_steps_per_sec": bench_env(env_steps, repeats),
+    }
+
+
+def compare(results, baseline, threshold):
+    # Returns (group, name, baseline rate, current rate) for every metric
+    # that dropped by more than threshold
+    regressions = []
+    for group, rates in results.items():
+        if group == "meta":
+            continue
+        for name, rate in rates.items():
+            base = baseline.get(group, {}).get(name)
+            if base and rate < base * (1 - threshold):
+                regressions.append((group, name, base, rate))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Azul engine and CPU strategies")
+    parser.add_argument("--output", default="bench.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown before failing")
+    parser.add_argument("--games", type=int, default=200, help="games per strategy pairing")
+    parser.add_argument("--positions", type=int, default=2000, help="positions timed per CPU algorithm")
+    parser.add_argument("--copies", type=int, default=2000, help="calls per microbenchmark")
+    parser.add_argument("--env-steps", type=int, default=20000, help="game steps timed per vector environment size")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per measurement, the best one is kept")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.games, args.positions, args.copies, args.repeats, args.env_steps)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    for group, rates in results.items():
+        if group != "meta":
+            print(group)
+            for name, rate in rates.items():
+                print(f"  {name:20} {rate:12.1f}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for group, name, base, rate in regressions:
+            print(f"Regression in {group}/{name}: {base:.1f} -> {rate:.1f} ({rate / base - 1:+.1%})")
+        if regressions:
+            sys.exit(1)
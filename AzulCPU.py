@@ -1,94 +1,185 @@
+import random
+
+from AzulRules import get_rules
+from AzulSearch import ISMCTS, MCTS, AlphaBeta, RootParallel
+
+PATTERN_RULES = get_rules('pattern')  # pattern_column follows the standard wall in any mode
+
+
+class TurnContext:
+    """The facts every CPU algorithm needs about one decision, computed once.
+
+    options holds one (source, color, count) entry per distinct color and
+    count on offer, from the first source offering it. The algorithms only
+    look at the color and count, and keep the first of equally good moves,
+    so the other sources offering the same never change their choice.
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.player = player = game.players[game.active_player]
+
+        self.options = options = []
+        seen = [0] * len(game.colors)  # bit count is set once (color, count) is in options
+        for source in game.sources:
+            counts = source.counts
+            for color in range(len(counts)):
+                count = counts[color]
+                if count and not seen[color] >> count & 1:
+                    seen[color] |= 1 << count
+                    options.append((source, color, count))
+
+        self.valid_lines = [None] * len(game.colors)  # filled in by lines()
+        self.spaces = [line + 1 - count for line, count in enumerate(player.pattern_counts)]
+
+    def lines(self, color):
+        # Valid pattern lines of a color, looked up at most once per decision
+        valid_lines = self.valid_lines[color]
+        if valid_lines is None:
+            valid_lines = self.valid_lines[color] = self.game.get_valid_lines(self.player, color)
+        return valid_lines
+
+
 class AzulCPU:
-    def __init__(self, game, algorithm):
+    def __init__(self, game, algorithm, placement='score', max_nodes=5000, max_time=None, playouts=1000, rollout='greedy',
+                 pool=None, workers=1, seed=0):
         self.game = game
         self.algorithm = algorithm
+        # Free mode column policy: a built-in name or a callable (game, player, row, color, valid_cols) -> col
+        self.placement = placement
+        # Per move budget of the search algorithms: alphabeta nodes, mcts playouts and seconds. Without
+        # max_time only the nodes or playouts limit them, so their games are reproducible.
+        self.max_nodes = max_nodes
+        self.playouts = playouts
+        self.max_time = max_time
+        self.rollout = rollout  # mcts rollout policy, 'greedy' or 'random'
+        # Process pool spreading mcts and ismcts over several workers, each with its own tree
+        self.pool = pool
+        self.workers = workers
+        self.search = None
+        # The CPU's own choices draw from here, never from game.rng, so they leave the tile draws alone
+        self.rng = random.Random(seed)
 
     def choose_move(self):
         if self.algorithm == 'dummy':
-            return self.dummy_algorithm()
+            return self.dummy_algorithm(TurnContext(self.game))
         elif self.algorithm == 'greedy':
-            return self.greedy_algorithm()
+            return self.greedy_algorithm(TurnContext(self.game))
         elif self.algorithm == 'smart':
-            return self.smart_algorithm()
+            return self.smart_algorithm(TurnContext(self.game))
         elif self.algorithm == 'strategic':
-            return self.strategic_algorithm()
-
-    def dummy_algorithm(self):
-        # Simple AI logic: choose the first available source and color, and the widest valid line
-        for source in self.game.factories + [self.game.center]:
-            chosen_color = next((tile.color for tile in source.tiles if tile.color != '1'), None)
-            if chosen_color:
-                player = self.game.players[self.game.active_player]
-                valid_lines = self.game.get_valid_lines(player, chosen_color)
-                chosen_line = max(valid_lines) if valid_lines else -1
-                return source, chosen_color, chosen_line
-
-    def greedy_algorithm(self):
+            return self.strategic_algorithm(TurnContext(self.game))
+        elif self.algorithm == 'alphabeta':
+            return self.alphabeta_algorithm()
+        elif self.algorithm == 'mcts':
+            return self.mcts_algorithm()
+        elif self.algorithm == 'ismcts':
+            return self.ismcts_algorithm()
+
+    def choose_column(self, player, row, color, valid_cols):
+        if callable(self.placement):
+            return self.placement(self.game, player, row, color, valid_cols)
+        elif self.placement == 'first':
+            return valid_cols[0]
+        elif self.placement == 'score':
+            return self.most_points_column(player, row, valid_cols)
+        elif self.placement == 'pattern':
+            return self.pattern_column(player, row, color, valid_cols)
+
+    def most_points_column(self, player, row, valid_cols):
+        # Highest immediate score, leftmost on ties
+        return max(valid_cols, key=lambda col: (self.game.tile_points(player, row, col), -col))
+
+    def pattern_column(self, player, row, color, valid_cols):
+        # Follow the standard wall pattern when possible so color bonuses stay
+        # reachable, otherwise fall back to the highest scoring column
+        col = PATTERN_RULES.wall_cols[row][color]
+        if col in valid_cols:
+            return col
+        return self.most_points_column(player, row, valid_cols)
+
+    # The algorithms take the TurnContext of the decision, and build it
+    # themselves when called directly, as the search strategies do
+
+    def dummy_algorithm(self, context=None):
+        # Simple AI logic: take the first available source, a random tile of it
+        # (so a color as likely as its count), and the widest valid line
+        context = context or TurnContext(self.game)
+        source = context.options[0][0]
+        counts = source.counts
+        pick = int(self.rng.random() * sum(counts))
+        for chosen_color, count in enumerate(counts):
+            pick -= count
+            if pick < 0:
+                break
+        valid_lines = context.lines(chosen_color)
+        chosen_line = max(valid_lines) if valid_lines else -1
+        return source, chosen_color, chosen_line
+
+    def greedy_algorithm(self, context=None):
+        context = context or TurnContext(self.game)
         best_move = None
         largest = 0
         least = float('inf')
-        player = self.game.players[self.game.active_player]
-
-        for source in self.game.factories + [self.game.center]:
-            for color in set(tile.color for tile in source.tiles if tile.color != '1'):
-                tiles = [tile for tile in source.tiles if tile.color == color]
-                for line_index in self.game.get_valid_lines(player, color):
-                    spaces = line_index + 1 - len(player.pattern_lines[line_index])
-                    if len(tiles) <= spaces:
-                        if len(tiles) > largest:
-                            largest = len(tiles)
+
+        for source, color, num_tiles in context.options:
+            for line_index in context.lines(color):
+                spaces = context.spaces[line_index]
+                if num_tiles <= spaces:
+                    if num_tiles > largest:
+                        largest = num_tiles
+                        best_move = (source, color, line_index)
+                        least = 0
+                    elif least != 0:
+                        tiles_too_many = abs(spaces - num_tiles)
+                        if tiles_too_many < least:
+                            least = tiles_too_many
                             best_move = (source, color, line_index)
-                            least = 0
-                        elif least != 0:
-                            tiles_too_many = abs(spaces - len(tiles))
-                            if tiles_too_many < least:
-                                least = tiles_too_many
-                                best_move = (source, color, line_index)
 
         if not best_move:
-            best_move = self.find_least_negative()
+            best_move = self.find_least_negative(context)
 
         return best_move
 
-    def smart_algorithm(self):
+    def smart_algorithm(self, context=None):
+        context = context or TurnContext(self.game)
         best_move = None
         least_whitespace = float('inf')
         most_tiles = 0
         move_found = False
         one_adjacent_move = False
-        player = self.game.players[self.game.active_player]
-
-        for source in self.game.factories + [self.game.center]:
-            for color in set(tile.color for tile in source.tiles if tile.color != '1'):
-                tiles = [tile for tile in source.tiles if tile.color == color]
-                for line_index in self.game.get_valid_lines(player, color):
-                    spaces = line_index + 1 - len(player.pattern_lines[line_index])
-                    if len(tiles) <= spaces:
-                        move_found = True
-                        whitespace = spaces - len(tiles)
-                        if whitespace <= least_whitespace:
-                            if whitespace < least_whitespace:
-                                least_whitespace = whitespace
-                                one_adjacent_move = False
-                                most_tiles = 0
-
-                            if not one_adjacent_move:
-                                if self.has_adjacent(self.game, player, line_index, color):
-                                    one_adjacent_move = True
-                                    best_move = (source, color, line_index)
-                                elif len(tiles) > most_tiles:
-                                    best_move = (source, color, line_index)
-                                    most_tiles = len(tiles)
+        player = context.player
+
+        for source, color, num_tiles in context.options:
+            for line_index in context.lines(color):
+                spaces = context.spaces[line_index]
+                if num_tiles <= spaces:
+                    move_found = True
+                    whitespace = spaces - num_tiles
+                    if whitespace <= least_whitespace:
+                        if whitespace < least_whitespace:
+                            least_whitespace = whitespace
+                            one_adjacent_move = False
+                            most_tiles = 0
+
+                        if not one_adjacent_move:
+                            if self.has_adjacent(self.game, player, line_index, color):
+                                one_adjacent_move = True
+                                best_move = (source, color, line_index)
+                            elif num_tiles > most_tiles:
+                                best_move = (source, color, line_index)
+                                most_tiles = num_tiles
 
         if not move_found:
-            best_move = self.find_least_overflow(player)
+            best_move = self.find_least_overflow(context)
 
         if not best_move:
-            best_move = self.find_least_negative()
+            best_move = self.find_least_negative(context)
 
         return best_move
 
-    def strategic_algorithm(self):
+    def strategic_algorithm(self, context=None):
+        context = context or TurnContext(self.game)
         best_move = None
         least_whitespace = float('inf')
         most_tiles = 0
@@ -96,100 +187,121 @@ class AzulCPU:
         diagonal_move = False
         one_adjacent_move = False
         two_adjacent_move = False
-        player = self.game.players[self.game.active_player]
-
-        for source in self.game.factories + [self.game.center]:
-            for color in set(tile.color for tile in source.tiles if tile.color != '1'):
-                tiles = [tile for tile in source.tiles if tile.color == color]
-                for line_index in self.game.get_valid_lines(player, color):
-                    spaces = line_index + 1 - len(player.pattern_lines[line_index])
-                    if len(tiles) <= spaces:
-                        move_found = True
-                        whitespace = spaces - len(tiles)
-                        if whitespace <= least_whitespace:
-                            if whitespace < least_whitespace:
-                                least_whitespace = whitespace
-                                diagonal_move = two_adjacent_move = one_adjacent_move = False
-                                most_tiles = 0
-
-                            if not diagonal_move:
-                                if self.game.round_num == 1:
-                                    if self.is_move_in_diagonal(self.game, line_index, color):
-                                        best_move = (source, color, line_index)
-                                        diagonal_move = True
-                                if not two_adjacent_move:
-                                    adj_horiziontal, adj_vertical = self.check_adjacents(self.game, player, line_index, color)
-                                    if adj_horiziontal and adj_vertical:
-                                        best_move = (source, color, line_index)
-                                        two_adjacent_move = True
-                                if not two_adjacent_move and not one_adjacent_move:
-                                    adj_horiziontal, adj_vertical = self.check_adjacents(self.game, player, line_index, color)
-                                    if adj_horiziontal or adj_vertical:
-                                        best_move = (source, color, line_index)
-                                        one_adjacent_move = True
-                                    elif len(tiles) > most_tiles:
-                                        best_move = (source, color, line_index)
-                                        most_tiles = len(tiles)
+        player = context.player
+
+        for source, color, num_tiles in context.options:
+            for line_index in context.lines(color):
+                spaces = context.spaces[line_index]
+                if num_tiles <= spaces:
+                    move_found = True
+                    whitespace = spaces - num_tiles
+                    if whitespace <= least_whitespace:
+                        if whitespace < least_whitespace:
+                            least_whitespace = whitespace
+                            diagonal_move = two_adjacent_move = one_adjacent_move = False
+                            most_tiles = 0
+
+                        if not diagonal_move:
+                            if self.game.round_num == 1:
+                                if self.is_move_in_diagonal(self.game, line_index, color):
+                                    best_move = (source, color, line_index)
+                                    diagonal_move = True
+                            if not two_adjacent_move:
+                                adj_horiziontal, adj_vertical = self.check_adjacents(self.game, player, line_index, color)
+                                if adj_horiziontal and adj_vertical:
+                                    best_move = (source, color, line_index)
+                                    two_adjacent_move = True
+                            if not two_adjacent_move and not one_adjacent_move:
+                                adj_horiziontal, adj_vertical = self.check_adjacents(self.game, player, line_index, color)
+                                if adj_horiziontal or adj_vertical:
+                                    best_move = (source, color, line_index)
+                                    one_adjacent_move = True
+                                elif num_tiles > most_tiles:
+                                    best_move = (source, color, line_index)
+                                    most_tiles = num_tiles
 
         if not move_found:
-            best_move = self.find_least_overflow(player)
+            best_move = self.find_least_overflow(context)
 
         if not best_move:
-            best_move = self.find_least_negative()
+            best_move = self.find_least_negative(context)
         
         return best_move
 
-    def find_least_overflow(self, player):
+    def alphabeta_algorithm(self):
+        # Searches the rest of the round, trying the strategic move first
+        if self.search is None:
+            self.search = AlphaBeta(self.game, self.strategic_algorithm, self.max_nodes, self.max_time)
+        source, color, line = self.search.choose_move()
+        return self.game.sources[source], color, line
+
+    def mcts_algorithm(self):
+        if self.search is None and self.pool is not None:
+            self.search = RootParallel(self.game, 'mcts', self.pool, self.workers, self.rollout, self.playouts, self.max_time)
+        elif self.search is None:
+            rollout = self.greedy_algorithm if self.rollout == 'greedy' else None
+            self.search = MCTS(self.game, rollout, self.playouts, self.max_time)
+        source, color, line = self.search.choose_move()
+        return self.game.sources[source], color, line
+
+    def ismcts_algorithm(self):
+        # Like mcts, but also searches the next round over sampled factory refills
+        if self.search is None and self.pool is not None:
+            self.search = RootParallel(self.game, 'ismcts', self.pool, self.workers, self.rollout, self.playouts, self.max_time)
+        elif self.search is None:
+            self.search = ISMCTS(self.game, self.rollout, self.playouts, self.max_time)
+        source, color, line = self.search.choose_move()
+        return self.game.sources[source], color, line
+
+    def find_least_overflow(self, context):
         best_move = None
         least = float('inf')
 
-        for source in self.game.factories + [self.game.center]:
-            for color in set(tile.color for tile in source.tiles if tile.color != '1'):
-                tiles = [tile for tile in source.tiles if tile.color == color]
-                for line_index in self.game.get_valid_lines(player, color):
-                    spaces = line_index + 1 - len(player.pattern_lines[line_index])
-                    tiles_too_many = abs(spaces - len(tiles))
-                    if tiles_too_many < least:
-                        least = tiles_too_many
-                        best_move = (source, color, line_index)
+        for source, color, num_tiles in context.options:
+            for line_index in context.lines(color):
+                tiles_too_many = abs(context.spaces[line_index] - num_tiles)
+                if tiles_too_many < least:
+                    least = tiles_too_many
+                    best_move = (source, color, line_index)
 
         return best_move
     
-    def find_least_negative(self):
+    def find_least_negative(self, context):
         min_floor_tiles = float('inf')
 
-        for source in self.game.factories + [self.game.center]:
-            for color in set(tile.color for tile in source.tiles if tile.color != '1'):
-                tiles = [tile for tile in source.tiles if tile.color == color]
-                if len(tiles) < min_floor_tiles:
-                    min_floor_tiles = len(tiles)
-                    best_move = (source, color, -1)
+        for source, color, num_tiles in context.options:
+            if num_tiles < min_floor_tiles:
+                min_floor_tiles = num_tiles
+                best_move = (source, color, -1)
 
         return best_move
     
     def has_adjacent(self, game, player, line_index, color):
         if game.mode == 'pattern':
-            col = game.wall_pattern[line_index].index(color)
+            col = game.wall_cols[line_index][color]
         else:
-            col = next((j for j in range(5) if player.wall[line_index][j] is None and all(player.wall[k][j] != color for k in range(5))), None)
-            if col is None:
+            valid_cols = game.valid_columns(player, line_index, color)
+            if not valid_cols:
                 return False
+            col = valid_cols[0]
 
         return self.check_adjacents(game, player, line_index, color, col)
 
     def check_adjacents(self, game, player, row, color, col=None):
         if col is None:
             if game.mode == 'pattern':
-                col = game.wall_pattern[row].index(color)
+                col = game.wall_cols[row][color]
             else:
-                col = next((j for j in range(5) if player.wall[row][j] is None and all(player.wall[k][j] != color for k in range(5))), None)
-                if col is None:
+                valid_cols = game.valid_columns(player, row, color)
+                if not valid_cols:
                     return (False, False)
+                col = valid_cols[0]
 
-        horizontal = (col > 0 and player.wall[row][col-1]) or (col < 4 and player.wall[row][col+1])
-        vertical = (row > 0 and player.wall[row-1][col]) or (row < 4 and player.wall[row+1][col])
+        cell = row * 5 + col
+        horizontal = bool(player.wall_mask & game.rules.row_neighbors[cell])
+        vertical = bool(player.wall_mask & game.rules.col_neighbors[cell])
 
         return (horizontal, vertical)
 
     def is_move_in_diagonal(self, game, row, color):
-        return row == game.wall_pattern[row].index(color) if game.mode == 'pattern' else row == color
+        return game.mode == 'pattern' and row == game.wall_cols[row][color]
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def play_interleaved(games, agent):
+    # Plays the games to the end side by side through AzulGame.decisions().
+    # agent is called with the pending Decision of every unfinished game and
+    # returns their answers in the same order, so one call serves them all.
+    loops = [game.decisions() for game in games]
+    pending = [next(loop) for loop in loops]  # a new game always waits on a move first
+    active = list(range(len(games)))
+    while active:
+        answers = agent([pending[i] for i in active])
+        still_active = []
+        for i, answer in zip(active, answers):
+            try:
+                pending[i] = loops[i].send(answer)
+                still_active.append(i)
+            except StopIteration:
+                pass
+        active = still_active
+    return games
+
+
+def cpu_agent(decisions):
+    # Answers each decision with the deciding player's CPU in game.ai, the
+    # way play_game does, so the games play exactly as play_game would
+    return [decision.game.decide(decision) for decision in decisions]
+
+
+class RandomAgent:
+    """Uniformly random answers, drawn for a whole batch of decisions at once."""
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, decisions):
+        counts = np.array([len(decision.options) for decision in decisions])
+        picks = (self.rng.random(len(decisions)) * counts).astype(int)
+        return [decision.options[pick] for decision, pick in zip(decisions, picks.tolist())]
@@ -0,0 +1,302 @@
+import numpy as np
+
+from AzulBatch import FULL_LINE, NUM_COLORS, NUM_LINES, AzulBatch
+from AzulGame import AzulGame
+from AzulRecord import LINE_CODES, decode_move, encode_move
+
+# LINE_CELLS[mask] is a 5-bit wall row as cells, and PATTERN_TILES[(color + 1)
+# * 6 + count] a pattern line as tiles per color, color -1 being an empty line
+LINE_CELLS = (np.arange(32)[:, None] >> np.arange(5) & 1).astype(np.float32)
+PATTERN_TILES = np.zeros(((NUM_COLORS + 1) * (NUM_LINES + 1), NUM_COLORS), dtype=np.float32)
+for _color in range(NUM_COLORS):
+    PATTERN_TILES[(_color + 1) * (NUM_LINES + 1) + np.arange(NUM_LINES + 1), _color] = np.arange(NUM_LINES + 1)
+BOARD_FEATURES = NUM_LINES * NUM_COLORS + NUM_LINES * 5 + NUM_COLORS + 2  # pattern lines, wall, floor, floor token, score
+
+
+class AzulVectorEnv:
+    """Gym-style vector environment over many pattern mode games.
+
+    Every game waits on the move of its active player. Actions are move
+    codes as in AzulRecord.encode_move, (source * 5 + color) * 6 + line + 1
+    with line -1 the floor, so masks[game, code] tells whether a move is
+    legal. step() plays one action in every game and returns (observations,
+    rewards, dones, masks). These arrays are allocated once and refilled by
+    every call, so copy them to keep them.
+
+    A game that ends is started over in the same step: dones is set for it,
+    final_scores keeps its scores and its observation is already the first
+    of the new game. The game logic is AzulBatch's, which plays as AzulGame
+    does in pattern mode.
+
+    An observation is seen by the player to move, whose board comes first
+    followed by the others in turn order. It holds the tiles of every source
+    (factories, then the center), the center's first player token, then
+    per board the pattern lines as tiles per line and color, the 25 wall
+    cells, the floor tiles per color, the floor token and the score, and
+    last the bag and discard counts. The reward of a step goes to the
+    player who moved. It is the change in that player's score minus the
+    best opponent score, including the wall tiling and end-of-game bonuses
+    the move triggered.
+    """
+
+    def __init__(self, num_envs, num_players=2, seed=None):
+        self.num_envs = num_envs
+        self.num_players = num_players
+        self.batch = AzulBatch(num_envs, num_players, policies=(), seed=seed)
+        self.num_sources = self.batch.num_factories + 1
+        self.num_actions = self.num_sources * NUM_COLORS * LINE_CODES
+        self.rows = np.arange(num_envs)
+        self.seat_offsets = np.arange(num_players)
+
+        n = num_envs
+        source_features = self.num_sources * NUM_COLORS + 1
+        self.observation_size = source_features + num_players * BOARD_FEATURES + 2 * NUM_COLORS
+        self.observations = np.zeros((n, self.observation_size), dtype=np.float32)
+        self.masks = np.zeros((n, self.num_actions), dtype=bool)
+        self.rewards = np.zeros(n, dtype=np.float32)
+        self.dones = np.zeros(n, dtype=bool)
+        self.final_scores = np.zeros((n, num_players), dtype=np.int32)
+
+        # Views into the buffers, one per observation field
+        obs = self.observations
+        self.obs_sources = obs[:, :source_features - 1].reshape(n, self.num_sources, NUM_COLORS)
+        self.obs_center_token = obs[:, source_features - 1]
+        boards = obs[:, source_features:source_features + num_players * BOARD_FEATURES].reshape(n, num_players, BOARD_FEATURES)
+        pattern_end = NUM_LINES * NUM_COLORS
+        wall_end = pattern_end + NUM_LINES * 5
+        self.obs_pattern = boards[:, :, :pattern_end].reshape(n, num_players, NUM_LINES, NUM_COLORS)
+        self.obs_wall = boards[:, :, pattern_end:wall_end].reshape(n, num_players, NUM_LINES, 5)
+        self.obs_floor = boards[:, :, wall_end:wall_end + NUM_COLORS]
+        self.obs_floor_token = boards[:, :, -2]
+        self.obs_score = boards[:, :, -1]
+        self.obs_bag = obs[:, -2 * NUM_COLORS:-NUM_COLORS]
+        self.obs_discard = obs[:, -NUM_COLORS:]
+        self.mask_moves = self.masks.reshape(n, self.num_sources, NUM_COLORS, LINE_CODES)
+        self.line_moves = np.ones((n, NUM_COLORS, LINE_CODES), dtype=bool)  # legal lines per color, floor first
+
+        # Scratch buffers of observe(). Boards are gathered through flat
+        # (game, seat) indices into contiguous arrays, then copied into the
+        # strided observation views. NumPy allocates temporaries for ufuncs
+        # that broadcast or mix dtypes, so none of the operations below do.
+        self.board_base = np.repeat(self.rows * num_players, num_players).reshape(n, num_players)
+        self.boards = np.zeros((n, num_players), dtype=np.int64)
+        self.line_colors = np.zeros((n, num_players, NUM_LINES), dtype=np.int8)
+        self.line_counts = np.zeros((n, num_players, NUM_LINES), dtype=np.int8)
+        self.line_index = np.zeros((n, num_players, NUM_LINES), dtype=np.int64)
+        self.wall_rows = np.zeros((n, num_players), dtype=np.int64)
+        self.wall_lines = np.zeros((n, num_players, NUM_LINES), dtype=np.int64)
+        self.board_floor_counts = np.zeros((n, num_players, NUM_COLORS), dtype=np.int8)
+        self.board_floor_tokens = np.zeros((n, num_players), dtype=bool)
+        self.board_scores = np.zeros((n, num_players), dtype=np.int32)
+        self.pattern_tiles = np.zeros(self.obs_pattern.shape, dtype=np.float32)
+        self.wall_cells = np.zeros(self.obs_wall.shape, dtype=np.float32)
+        # Source tiles repeated to the masks' layout, one count per line code,
+        # and the legal lines repeated once per source
+        self.mask_sources = np.repeat(np.arange(self.num_sources * NUM_COLORS), LINE_CODES)
+        self.mask_lines = np.tile(np.arange(NUM_COLORS * LINE_CODES), self.num_sources)
+        self.available = np.zeros((n, self.num_actions), dtype=np.int8)
+        self.source_lines = np.zeros((n, self.num_actions), dtype=np.int8)
+        self.observe()
+
+    def reset(self, seed=None):
+        # Starts every game over, reseeding the tile draws when seed is given.
+        # Returns (observations, masks).
+        if seed is not None:
+            self.batch.rng = np.random.default_rng(seed)
+        self.batch.reset(self.rows)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        self.final_scores[:] = 0
+        self.observe()
+        return self.observations, self.masks
+
+    def step(self, actions):
+        batch = self.batch
+        actions = np.asarray(actions)
+        if not self.masks[self.rows, actions].all():
+            raise ValueError("Illegal action in games " + str(np.nonzero(~self.masks[self.rows, actions])[0].tolist()))
+
+        source_color, slot = np.divmod(actions, LINE_CODES)
+        source, color = np.divmod(source_color, NUM_COLORS)
+        player = batch.active_player.copy()
+        lead_before = self.lead(player)
+
+        batch.take_tiles(self.rows, player, source, color, slot - 1)
+        batch.active_player += 1
+        batch.active_player %= self.num_players
+
+        ended = np.nonzero(batch.round_over())[0]
+        finished = ended
+        if len(ended):
+            batch.move_to_wall(ended)
+            complete = batch.has_complete_row(ended)
+            finished, ongoing = ended[complete], ended[~complete]
+            batch.end_game_scoring(finished)
+            batch.reset_factories(ongoing)
+            batch.round_num[ongoing] += 1
+            batch.active_player[ongoing] = batch.first_player_token[ongoing]
+
+        np.subtract(self.lead(player), lead_before, out=self.rewards)
+        self.dones[:] = False
+        if len(finished):
+            self.dones[finished] = True
+            self.final_scores[finished] = batch.scores[finished]
+            batch.reset(finished)
+
+        self.observe()
+        return self.observations, self.rewards, self.dones, self.masks
+
+    def lead(self, player):
+        # Score of player in each game minus the best of the other players
+        scores = self.batch.scores
+        others = np.where(self.seat_offsets == player[:, None], np.iinfo(scores.dtype).min, scores)
+        return scores[self.rows, player] - others.max(axis=1)
+
+    def observe(self):
+        # Refills the observations and masks in place. Only the legal lines
+        # from AzulBatch.valid_lines are allocated, like the rule steps of
+        # AzulBatch that step() runs.
+        batch = self.batch
+        self.obs_sources[...] = batch.sources
+        self.obs_center_token[...] = batch.center_token
+        self.obs_bag[...] = batch.bag
+        self.obs_discard[...] = batch.discard
+
+        # Boards in turn order from the player to move
+        boards = self.boards
+        for seat in range(self.num_players):
+            np.add(batch.active_player, seat, out=boards[:, seat])
+        np.remainder(boards, self.num_players, out=boards)
+        boards += self.board_base
+
+        np.take(batch.pattern_colors.reshape(-1, NUM_LINES), boards, axis=0, out=self.line_colors, mode='clip')
+        np.take(batch.pattern_counts.reshape(-1, NUM_LINES), boards, axis=0, out=self.line_counts, mode='clip')
+        line_colors = self.line_colors
+        line_colors += 1
+        line_colors *= NUM_LINES + 1
+        line_colors += self.line_counts
+        np.copyto(self.line_index, line_colors)
+        np.take(PATTERN_TILES, self.line_index, axis=0, out=self.pattern_tiles, mode='clip')
+        np.copyto(self.obs_pattern, self.pattern_tiles)
+
+        np.take(batch.walls.reshape(-1), boards, out=self.wall_rows, mode='clip')
+        for line in range(NUM_LINES):
+            np.right_shift(self.wall_rows, line * 5, out=self.wall_lines[..., line])
+        self.wall_lines &= FULL_LINE
+        np.take(LINE_CELLS, self.wall_lines, axis=0, out=self.wall_cells, mode='clip')
+        np.copyto(self.obs_wall, self.wall_cells)
+
+        np.take(batch.floor_counts.reshape(-1, NUM_COLORS), boards, axis=0, out=self.board_floor_counts, mode='clip')
+        np.copyto(self.obs_floor, self.board_floor_counts)
+        np.take(batch.floor_token.reshape(-1), boards, out=self.board_floor_tokens, mode='clip')
+        np.copyto(self.obs_floor_token, self.board_floor_tokens)
+        np.take(batch.scores.reshape(-1), boards, out=self.board_scores, mode='clip')
+        np.copyto(self.obs_score, self.board_scores)
+
+        # A move is legal when its source has tiles of the color and the line
+        # takes them, both gathered to the masks' layout first
+        self.line_moves[:, :, 1:] = batch.valid_lines(self.rows, batch.active_player)
+        np.take(batch.sources.reshape(self.num_envs, -1), self.mask_sources, axis=1, out=self.available, mode='clip')
+        np.take(self.line_moves.view(np.int8).reshape(self.num_envs, -1), self.mask_lines, axis=1, out=self.source_lines, mode='clip')
+        np.logical_and(self.available, self.source_lines, out=self.masks)
+
+
+class MirrorGame(AzulGame):
+    """AzulGame drawing the same factory fills as one game of an AzulBatch.
+
+    Every fill copies the factories and the bag of that game, so both
+    engines play the same tiles. The state hash is not kept up to date.
+    """
+
+    def __init__(self, batch, index):
+        super().__init__(batch.num_players, verbose=False, seed=0)
+        self.batch = batch
+        self.index = index
+
+    def fill_factories(self):
+        for factory in self.factories:
+            factory.counts[:] = self.batch.sources[self.index, factory.index].tolist()
+        self.center.counts[:] = [0] * len(self.colors)
+        self.center.first_player_token = True
+        self.bag[:] = self.batch.bag[self.index].tolist()
+
+
+def game_observation(game):
+    # The observation AzulVectorEnv gives of game, built from AzulGame's state
+    observation = [count for source in game.sources for count in source.counts] + [game.center.first_player_token]
+    for seat in range(len(game.players)):
+        player = game.players[(game.active_player + seat) % len(game.players)]
+        for color, count in zip(player.pattern_colors, player.pattern_counts):
+            observation += [count if color == other else 0 for other in range(NUM_COLORS)]
+        observation += [player.wall_mask >> cell & 1 for cell in range(25)]
+        observation += player.floor_counts + [player.floor_token, player.score]
+    return observation + game.bag + game.discard
+
+
+def check_games(num_envs=64, steps=1000, num_players=2, seed=0):
+    # Plays random legal moves in a vector environment and the same moves in
+    # a MirrorGame per environment, and checks after every step that the
+    # scores, rewards, observations and legal move masks agree. Raises
+    # AssertionError on the first difference, otherwise returns the number
+    # of moves checked.
+    env = AzulVectorEnv(num_envs, num_players, seed=seed)
+    rng = np.random.default_rng(seed)
+    games = [None] * num_envs
+    decisions = [None] * num_envs
+
+    def start(index):
+        games[index] = MirrorGame(env.batch, index)
+        decisions[index] = games[index].decisions()
+        next(decisions[index])
+
+    def lead(game, player):
+        scores = [other.score for other in game.players]
+        return scores[player] - max(score for seat, score in enumerate(scores) if seat != player)
+
+    def check(index, step):
+        game = games[index]
+        where = f"in game {index} after step {step}"
+        if game_observation(game) != env.observations[index].tolist():
+            raise AssertionError(f"Observations differ {where}")
+        if sorted(encode_move(*move) for move in game.legal_moves()) != np.nonzero(env.masks[index])[0].tolist():
+            raise AssertionError(f"Legal move masks differ {where}")
+
+    for index in range(num_envs):
+        start(index)
+        check(index, 0)
+
+    for step in range(1, steps + 1):
+        actions = (rng.random(env.masks.shape) * env.masks).argmax(axis=1)
+        _, rewards, dones, _ = env.step(actions)
+        for index, game in enumerate(games):
+            player = game.active_player
+            before = lead(game, player)
+            try:
+                decisions[index].send(decode_move(int(actions[index])))
+                finished = False
+            except StopIteration:
+                finished = True
+            where = f"in game {index} after step {step}"
+            if finished != dones[index]:
+                raise AssertionError(f"Game ends differ {where}")
+            if rewards[index] != lead(game, player) - before:
+                raise AssertionError(f"Rewards differ {where}")
+            scores = env.final_scores[index] if finished else env.batch.scores[index]
+            if [other.score for other in game.players] != scores.tolist():
+                raise AssertionError(f"Scores differ {where}")
+            if finished:
+                start(index)
+            check(index, step)
+    return num_envs * steps
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check AzulVectorEnv and AzulBatch against AzulGame on the same tiles")
+    parser.add_argument("--envs", type=int, default=64, help="games played side by side")
+    parser.add_argument("--steps", type=int, default=1000, help="moves played in every game")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"{check_games(args.envs, args.steps, args.players, args.seed)} moves checked")
@@ -0,0 +1,67 @@
+class Event:
+    """Something that happened in a game, passed to every sink attached to it.
+
+    Events hold references to the live game objects, so a sink reading them
+    sees the state right after the event. Sinks are plain callables taking
+    the game and the event.
+    """
+
+    __slots__ = ()
+
+
+class RoundStarted(Event):
+    __slots__ = ("round_num",)
+
+    def __init__(self, round_num):
+        self.round_num = round_num
+
+
+class TurnStarted(Event):
+    __slots__ = ("player",)
+
+    def __init__(self, player):
+        self.player = player
+
+
+class TurnTaken(Event):
+    __slots__ = ("player", "source", "color", "line")
+
+    def __init__(self, player, source, color, line):
+        self.player = player
+        self.source = source
+        self.color = color
+        self.line = line  # -1 for the floor line
+
+
+class TileScored(Event):
+    __slots__ = ("player", "row", "col", "points")
+
+    def __init__(self, player, row, col, points):
+        self.player = player
+        self.row = row
+        self.col = col
+        self.points = points
+
+
+class TilesFloored(Event):
+    # A full free mode pattern line with no legal wall column
+    __slots__ = ("player", "row", "color")
+
+    def __init__(self, player, row, color):
+        self.player = player
+        self.row = row
+        self.color = color
+
+
+class RoundEnded(Event):
+    __slots__ = ("round_num",)
+
+    def __init__(self, round_num):
+        self.round_num = round_num
+
+
+class GameOver(Event):
+    __slots__ = ("winner",)
+
+    def __init__(self, winner):
+        self.winner = winner
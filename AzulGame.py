@@ -1,116 +1,395 @@
 import random
 
 from AzulCPU import AzulCPU
-
-
-class Tile:
-    def __init__(self, color):
-        self.color = color
+from AzulEvents import GameOver, RoundEnded, RoundStarted, TileScored, TilesFloored, TurnStarted, TurnTaken
+from AzulRender import TerminalRenderer, format_options, format_player_board, write_frame
+from AzulRules import COLORS, FULL_LINE, get_rules
+from AzulZobrist import (ACTIVE_PLAYER_KEYS, CENTER_TOKEN_KEY, FIRST_PLAYER_KEYS, FLOOR_KEYS, FLOOR_TOKEN_KEYS, PATTERN_KEYS,
+                         SCORE_KEYS, SOURCE_KEYS, WALL_KEYS)
 
 
 class Source:
-    def __init__(self, name):
+    def __init__(self, name, index, num_colors=5):
         self.name = name
-        self.tiles = []
+        self.index = index  # position in AzulGame.sources, the center is last
+        self.counts = [0] * num_colors  # number of tiles of each color index
+        self.first_player_token = False
+
+    def is_empty(self):
+        return not any(self.counts)
+
+    def size(self):
+        return sum(self.counts) + self.first_player_token
+
+    def clone(self):
+        source = Source.__new__(Source)
+        source.name = self.name
+        source.index = self.index
+        source.counts = list(self.counts)
+        source.first_player_token = self.first_player_token
+        return source
 
 
 class Player:
-    def __init__(self, name, board_size=5):
+    def __init__(self, name, index, board_size=5, num_colors=5):
         self.name = name
-        self.pattern_lines = [[] for _ in range(board_size)]
-        self.wall = [[None for _ in range(board_size)] for _ in range(board_size)]
-        self.floor_line = []
+        self.index = index  # position in AzulGame.players
+        self.board_size = board_size
+        self.pattern_colors = [None] * board_size  # color index held by each pattern line
+        self.pattern_counts = [0] * board_size
+        self.wall_mask = 0  # bit row * 5 + col is set when that wall cell is tiled
+        self.wall_mask_t = 0  # transposed copy: bit col * 5 + row
+        self.color_masks = [0] * num_colors  # occupancy mask of the cells holding each color
+        self.color_cols = [0] * num_colors  # bit col is set when the color is in that column
+        # Tiles placed per row, column and color, and how many of each are complete
+        self.row_counts = [0] * board_size
+        self.col_counts = [0] * board_size
+        self.color_counts = [0] * num_colors
+        self.complete_rows = self.complete_cols = self.complete_colors = 0
+        self.floor_counts = [0] * num_colors
+        self.floor_token = False
         self.score = 0
 
+    def clone(self):
+        player = Player.__new__(Player)
+        player.__dict__.update(self.__dict__)
+        player.pattern_colors = list(self.pattern_colors)
+        player.pattern_counts = list(self.pattern_counts)
+        player.color_masks = list(self.color_masks)
+        player.color_cols = list(self.color_cols)
+        player.row_counts = list(self.row_counts)
+        player.col_counts = list(self.col_counts)
+        player.color_counts = list(self.color_counts)
+        player.floor_counts = list(self.floor_counts)
+        return player
+
+    @property
+    def wall(self):
+        # List view of the wall (color indices), rebuilt from the color masks for display
+        wall = [[None for _ in range(self.board_size)] for _ in range(self.board_size)]
+        for color, mask in enumerate(self.color_masks):
+            for cell in range(self.board_size * self.board_size):
+                if mask >> cell & 1:
+                    wall[cell // 5][cell % 5] = color
+        return wall
+
+    def floor_size(self):
+        return sum(self.floor_counts) + self.floor_token
+
+    def place_on_wall(self, row, col, color):
+        self.wall_mask |= 1 << (row * 5 + col)
+        self.wall_mask_t |= 1 << (col * 5 + row)
+        self.color_masks[color] |= 1 << (row * 5 + col)
+        self.color_cols[color] |= 1 << col
+        self.row_counts[row] += 1
+        self.col_counts[col] += 1
+        self.color_counts[color] += 1
+        self.complete_rows += self.row_counts[row] == 5
+        self.complete_cols += self.col_counts[col] == 5
+        self.complete_colors += self.color_counts[color] == 5
+
+    def row_mask(self, row):
+        return self.wall_mask >> (row * 5) & FULL_LINE
+
+    def col_mask(self, col):
+        return self.wall_mask_t >> (col * 5) & FULL_LINE
+
+    def has_color_in_row(self, row, color):
+        return bool(self.color_masks[color] >> (row * 5) & FULL_LINE)
+
+    def has_color_in_col(self, col, color):
+        return bool(self.color_cols[color] >> col & 1)
+
+    def has_complete_row(self):
+        return self.complete_rows > 0
+
+
+class Decision:
+    """A choice the game loop is waiting on.
+
+    kind is 'move', answered with one of the (source index, color, line)
+    moves in options, or in free mode 'column', answered with one of the
+    wall columns in options for the tile of the full pattern line row.
+    game is the live game, which stays as it is until the answer is sent.
+    The options of a move are only listed when they are first read.
+    """
+
+    __slots__ = ('game', 'player', 'kind', '_options', 'row', 'color')
+
+    def __init__(self, game, player, kind, options=None, row=None, color=None):
+        self.game = game
+        self.player = player  # index of the deciding player
+        self.kind = kind
+        self._options = options
+        self.row = row
+        self.color = color
+
+    @property
+    def options(self):
+        if self._options is None:
+            self._options = self.game.legal_moves()
+        return self._options
+
 
 class AzulGame:
-    def __init__(self, num_players, mode='pattern', verbose=True):
-        self.players = [Player(f"Player {i+1}") for i in range(num_players)]
-        self.ai = [AzulCPU(self, "dummy") for _ in range(num_players)]
-
-        self.factories = [Source(f"Factory {i+1}") for i in range(num_players * 2 + 1)]
-        self.center = Source("Center")
-        self.bag = []
-        self.discard = []
-        
+    def __init__(self, num_players, mode='pattern', verbose=True, seed=None):
+        # seed may be an int (or None for OS entropy) or a ready random.Random
+        self.rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+        self.players = [Player(f"Player {i+1}", i) for i in range(num_players)]
+        self.ai = [AzulCPU(self, "dummy", seed=seat) for seat in range(num_players)]
+
+        self.rules = get_rules(mode)
+        self.factories = [Source(f"Factory {i+1}", i) for i in range(self.rules.factory_count(num_players))]
+        self.center = Source("Center", len(self.factories))
+        self.sources = self.factories + [self.center]
+        self.bag = [0] * len(COLORS)  # tiles left in the bag per color
+        self.discard = [0] * len(COLORS)
+
         self.round_num = 1
         self.active_player = 0
         self.first_player_token = 0
+        # Zobrist hash of the sources and player boards, kept up to date by
+        # every change to them. state_hash() adds the turn order.
+        self.zobrist = 0
         self.mode = mode
-        self.verbose = verbose
-
-        self.colors = ['R', 'B', 'Y', 'K', 'W']  # Red, Blue, Yellow, blacK, White
-        if mode == 'pattern':
-            self.wall_pattern = [
-                ['B', 'Y', 'R', 'K', 'W'],
-                ['W', 'B', 'Y', 'R', 'K'],
-                ['K', 'W', 'B', 'Y', 'R'],
-                ['R', 'K', 'W', 'B', 'Y'],
-                ['Y', 'R', 'K', 'W', 'B']
-            ]
-        else:
-            self.wall_pattern = [[None for _ in range(5)] for _ in range(5)]
+        # Event sinks, callables (game, event). Attaching one turns the game
+        # into an ObservedAzulGame, so events are only built while observed.
+        # verbose attaches the terminal renderer.
+        self.sinks = []
+        if verbose:
+            self.attach(TerminalRenderer())
+
+        self.colors = self.rules.colors
+        self.wall_cols = self.rules.wall_cols  # None in free mode
+
+    def clone(self):
+        # Copy of the game state for search, without sinks. The copy shares
+        # the CPUs and the random generator until the caller replaces them.
+        game = AzulGame.__new__(AzulGame)
+        game.__dict__.update(self.__dict__)
+        game.players = [player.clone() for player in self.players]
+        game.factories = [factory.clone() for factory in self.factories]
+        game.center = self.center.clone()
+        game.sources = game.factories + [game.center]
+        game.bag = list(self.bag)
+        game.discard = list(self.discard)
+        game.sinks = []
+        return game
 
     def setup_game(self):
-        self.bag = [Tile(color) for color in self.colors for _ in range(20)]
-        random.shuffle(self.bag)
+        self.bag = list(self.rules.bag)
+        self.fill_factories()
+
+    def fill_factories(self):
+        # Tiles of one color are interchangeable, so each draw picks a color
+        # with probability proportional to its count in the bag
+        bag = self.bag
+        remaining = sum(bag)
+        h = self.zobrist
         for factory in self.factories:
-            factory.tiles = [self.bag.pop() for _ in range(4) if self.bag]
-        self.center.tiles = [Tile('1')]
+            counts = factory.counts
+            keys = SOURCE_KEYS[factory.index]
+            for color in range(len(counts)):
+                h ^= keys[color][counts[color]]
+                counts[color] = 0
+            for _ in range(self.rules.tiles_per_factory):
+                if not remaining:
+                    break
+                pick = int(self.rng.random() * remaining)
+                color = 0
+                while pick >= bag[color]:
+                    pick -= bag[color]
+                    color += 1
+                bag[color] -= 1
+                counts[color] += 1
+                remaining -= 1
+            for color in range(len(counts)):
+                h ^= keys[color][counts[color]]
+
+        keys = SOURCE_KEYS[self.center.index]
+        for color in range(len(self.center.counts)):
+            h ^= keys[color][self.center.counts[color]]
+            self.center.counts[color] = 0
+        if not self.center.first_player_token:
+            h ^= CENTER_TOKEN_KEY
+        self.center.first_player_token = True
+        self.zobrist = h
 
     def play_round(self):
+        self.run(self.turn_decisions())
+
+    def turn_decisions(self):
+        # The turns of a round, yielding each move to make
         self.active_player = self.first_player_token
-        while any(factory.tiles for factory in self.factories) or self.is_center_valid_choice():
+        while not self.round_over():
             player = self.players[self.active_player]
-            if self.verbose:
-                self.display_game_state()
-            self.play_turn(player, is_ai=(self.ai[self.active_player] is not None))
-            self.active_player = (self.active_player + 1) % len(self.players)
+            self.take_turn(player, (yield self.move_decision(player)))
+
+    def move_decision(self, player):
+        return Decision(self, player.index, 'move')
+
+    def state_hash(self):
+        return self.zobrist ^ ACTIVE_PLAYER_KEYS[self.active_player] ^ FIRST_PLAYER_KEYS[self.first_player_token]
+
+    def round_over(self):
+        return all(factory.is_empty() for factory in self.factories) and not self.is_center_valid_choice()
+
+    def attach(self, sink):
+        self.sinks.append(sink)
+        if not isinstance(self, ObservedAzulGame):
+            self.__class__ = ObservedAzulGame
 
     def play_turn(self, player, is_ai=False):
-        if self.verbose:
-            print(f"\n{player.name}'s turn")
-        
+        self.take_turn(player, self.choose_move(player, is_ai))
+
+    def choose_move(self, player, is_ai):
+        # The move of player, from its CPU or asked from a human
         if is_ai:
-            chosen_source, chosen_color, chosen_line = self.ai[self.active_player].choose_move()
+            chosen_source, chosen_color, chosen_line = self.ai[player.index].choose_move()
         else:
             chosen_source, chosen_color, chosen_line = self.user_input()
+        return chosen_source.index, chosen_color, chosen_line
+
+    def take_turn(self, player, move):
+        self.apply_move(move)
+
+    def run(self, decisions):
+        # Plays a decision generator through, answering every decision with
+        # self.ai or the user. Returns the generator's return value.
+        try:
+            decision = next(decisions)
+            while True:
+                decision = decisions.send(self.decide(decision))
+        except StopIteration as stop:
+            return stop.value
+
+    def decide(self, decision):
+        player = self.players[decision.player]
+        if decision.kind == 'move':
+            return self.choose_move(player, is_ai=self.ai[player.index] is not None)
+        return self.choose_column(player, decision.row, decision.color, decision.options)
+
+    def legal_moves(self, unique=False):
+        # Moves (source index, color, line) of the active player, line -1 is
+        # the floor line. Empty once the round is over. With unique, a factory
+        # move is left out when an earlier factory move takes the same count
+        # of the same color and sends the same leftovers to the center: both
+        # lead to the same position up to which factory is empty. Center moves
+        # are always kept, the center alone holds the first player token.
+        if self.round_over():
+            return []
+        player = self.players[self.active_player]
+        moves = []
+        seen = set()
+        for source in self.sources:
+            contents = tuple(source.counts) if unique and source is not self.center else None
+            for color, count in enumerate(source.counts):
+                if count:
+                    if contents is not None:
+                        # The counts give the tiles taken and the leftovers
+                        if (color, contents) in seen:
+                            continue
+                        seen.add((color, contents))
+                    for line in self.get_valid_lines(player, color):
+                        moves.append((source.index, color, line))
+                    moves.append((source.index, color, -1))
+        return moves
+
+    def apply_move(self, move):
+        # Plays a move for the active player and passes the turn. Returns an
+        # undo token holding just what undo_move needs to restore the state.
+        source_index, color, line = move
+        player_index = self.active_player
+        player = self.players[player_index]
+        source = self.sources[source_index]
+        previous_hash = h = self.zobrist
 
         # Take tiles
-        taken_tiles = [tile for tile in chosen_source.tiles if tile.color == chosen_color]
-
-        # Move tiles to center or update center
-        if chosen_source != self.center:
-            self.center.tiles.extend([tile for tile in chosen_source.tiles if tile.color != chosen_color])
-            chosen_source.tiles.clear()
-        else:
-            self.center.tiles = [tile for tile in self.center.tiles if tile.color != chosen_color]
+        taken = source.counts[color]
+        source.counts[color] = 0
+        h ^= SOURCE_KEYS[source_index][color][taken]
+
+        # Move leftover tiles to center
+        leftovers = None
+        token = False
+        if source is not self.center:
+            leftovers = tuple(source.counts)
+            center_counts = self.center.counts
+            source_counts = source.counts
+            source_keys = SOURCE_KEYS[source_index]
+            center_keys = SOURCE_KEYS[self.center.index]
+            for i in range(len(source_counts)):
+                count = source_counts[i]
+                if count:
+                    h ^= source_keys[i][count] ^ center_keys[i][center_counts[i]] ^ center_keys[i][center_counts[i] + count]
+                    center_counts[i] += count
+                    source_counts[i] = 0
 
         # Handle first player token
-        if chosen_source == self.center and any(tile.color == '1' for tile in self.center.tiles):
-            self.center.tiles = [tile for tile in self.center.tiles if tile.color != '1']
-            self.first_player_token = self.players.index(player)
-            player.floor_line.append(Tile('1'))
+        elif self.center.first_player_token:
+            token = True
+            self.center.first_player_token = False
+            player.floor_token = True
+            h ^= CENTER_TOKEN_KEY ^ FLOOR_TOKEN_KEYS[player_index]
 
         # Place tiles
-        if chosen_line != -1:
-            spaces = chosen_line + 1 - len(player.pattern_lines[chosen_line])
-            player.pattern_lines[chosen_line].extend(taken_tiles[:spaces])
-            player.floor_line.extend(taken_tiles[spaces:])
+        floor_keys = FLOOR_KEYS[player_index][color]
+        floor_count = player.floor_counts[color]
+        if line != -1:
+            previous_color = player.pattern_colors[line]
+            count = player.pattern_counts[line]
+            placed = min(taken, line + 1 - count)
+            line_keys = PATTERN_KEYS[player_index][line]
+            h ^= line_keys[color][count + placed]
+            if count:
+                h ^= line_keys[previous_color][count]
+            player.pattern_colors[line] = color
+            player.pattern_counts[line] += placed
         else:
-            player.floor_line.extend(taken_tiles)
-
-        # Display turn results
-        if self.verbose:
-            self.display_turn_results(player, chosen_source, chosen_color, chosen_line)
+            previous_color = None
+            placed = 0
+        player.floor_counts[color] += taken - placed
+        h ^= floor_keys[floor_count] ^ floor_keys[floor_count + taken - placed]
+        self.zobrist = h
+
+        undo_token = (move, player_index, taken, leftovers, token, self.first_player_token, previous_color, placed, previous_hash)
+        if token:
+            self.first_player_token = player_index
+        self.active_player = (player_index + 1) % len(self.players)
+        return undo_token
+
+    def undo_move(self, undo_token):
+        (source_index, color, line), player_index, taken, leftovers, token, first_player_token, previous_color, placed, previous_hash = undo_token
+        player = self.players[player_index]
+        source = self.sources[source_index]
+
+        self.active_player = player_index
+        self.first_player_token = first_player_token
+        self.zobrist = previous_hash
+
+        if line != -1:
+            player.pattern_counts[line] -= placed
+            player.pattern_colors[line] = previous_color
+        player.floor_counts[color] -= taken - placed
+
+        if leftovers is not None:
+            center_counts = self.center.counts
+            for i in range(len(leftovers)):
+                center_counts[i] -= leftovers[i]
+                source.counts[i] = leftovers[i]
+        elif token:
+            self.center.first_player_token = True
+            player.floor_token = False
+
+        source.counts[color] = taken
 
     def user_input(self):
         # Display available options
         self.display_options()
-        
+
         # Get user input for source choice
         chosen_source = self.get_user_source_choice()
-        
+
         # Get user input for color choice
         chosen_color = self.get_user_color_choice(chosen_source)
 
@@ -118,20 +397,14 @@ class AzulGame:
         player = self.players[self.active_player]
         valid_lines = self.get_valid_lines(player, chosen_color)
         chosen_line = self.choose_pattern_line(player, valid_lines)
-        
+
         return chosen_source, chosen_color, chosen_line
 
     def display_options(self):
-        print("\nAvailable factories:")
-        for factory in self.factories:
-            if factory.tiles:
-                print(f"{factory.name}: {' '.join(tile.color for tile in factory.tiles)}")
-        
-        if self.center.tiles:
-            print(f"Center: {' '.join(tile.color for tile in self.center.tiles)}")
+        write_frame(format_options(self))
 
     def get_user_source_choice(self):
-        valid_factories = [factory.name[-1] for factory in self.factories if factory.tiles]
+        valid_factories = [factory.name[-1] for factory in self.factories if not factory.is_empty()]
         while True:
             if valid_factories:
                 if self.is_center_valid_choice():
@@ -148,20 +421,21 @@ class AzulGame:
                 print("Factories are empty, selecting from center.")
                 return self.center
             print("Invalid choice. Please try again.")
-    
+
     def is_center_valid_choice(self):
-        return len(self.center.tiles) > 2 or (len(self.center.tiles) == 1 and self.center.tiles[0].color != '1')
+        size = self.center.size()
+        return size > 2 or (size == 1 and not self.center.first_player_token)
 
     def get_user_color_choice(self, chosen_source):
-        available_colors = set(tile.color for tile in chosen_source.tiles if tile.color != '1')
+        available_colors = [self.colors[color] for color, count in enumerate(chosen_source.counts) if count]
         while True:
             color = input(f"Choose a color ({', '.join(available_colors)}): ").upper()
             if color in available_colors:
-                return color
+                return self.rules.color_index[color]
             print("Invalid color. Please try again.")
 
     def choose_pattern_line(self, player, valid_lines):
-        self.display_player_board(player)
+        write_frame(format_player_board(self, player))
         while True:
             line = input(f"Choose a pattern line ({', '.join([str(line + 1) for line in valid_lines])}), or F for floor line: ").upper()
             if line == 'F':
@@ -170,162 +444,180 @@ class AzulGame:
                 return int(line) - 1
             print("Invalid choice. Please try again.")
 
-    def display_turn_results(self, player, chosen_source, chosen_color, chosen_line):
-        print(f"{player.name} chose {chosen_source.name} and color {chosen_color}")
-        
-        if chosen_line != -1:
-            print(f"{player.name} placed tiles on Pattern Line {chosen_line + 1}")
-        else:
-            print(f"{player.name} placed tiles on the Floor Line")
-
     def get_valid_lines(self, player, color):
         valid_lines = []
-        for i, line in enumerate(player.pattern_lines):
-            if len(line) == 0 or (line[0].color == color and len(line) < i + 1):
-                if self.mode == 'pattern':
-                    if color not in player.wall[i]:
-                        valid_lines.append(i)
-                else:
-                    if color not in player.wall[i] and all(player.wall[i][j] != color for j in range(5)):
-                        valid_lines.append(i)
+        for i in range(len(player.pattern_counts)):
+            count = player.pattern_counts[i]
+            if count == 0 or (player.pattern_colors[i] == color and count < i + 1):
+                if not player.has_color_in_row(i, color):
+                    valid_lines.append(i)
         return valid_lines
 
     def end_round(self):
+        self.run(self.end_round_decisions())
+
+    def end_round_decisions(self):
         for player in self.players:
-            self.move_to_wall(player)
+            yield from self.wall_decisions(player)
         self.reset_factories()
 
     def move_to_wall(self, player):
-        for i, line in enumerate(player.pattern_lines):
-            if len(line) == i + 1:
-                color = line[0].color
+        self.run(self.wall_decisions(player))
+
+    def wall_decisions(self, player):
+        # Wall tiling of player's full pattern lines, yielding the column of
+        # each tile in free mode
+        for i in range(len(player.pattern_counts)):
+            if player.pattern_counts[i] == i + 1:
+                color = player.pattern_colors[i]
                 if self.mode == 'pattern':
-                    col = self.wall_pattern[i].index(color)
-                    player.wall[i][col] = color
-                    self.score_tile(player, i, col)
-                    self.discard.extend(line)
+                    col = self.wall_cols[i][color]
                 else:
-                    valid_cols = [j for j in range(5) if player.wall[i][j] is None and all(player.wall[k][j] != color for k in range(5))]
-                    if valid_cols:
-                        print(f"Valid columns for {color} tile: {', '.join(map(str, [c+1 for c in valid_cols]))}")
-                        while True:
-                            col = input(f"Choose a column (1-5) for the {color} tile: ")
-                            if col.isdigit() and int(col) - 1 in valid_cols:
-                                col = int(col) - 1
-                                break
-                            else:
-                                print("Invalid column. Please try again.")
-                        player.wall[i][col] = color
-                        self.score_tile(player, i, col)
-                        self.discard.extend(line)
-                    else:
-                        print(f"No valid columns for {color} tile. Moving to floor line.")
-                        player.floor_line.extend(line)
-                player.pattern_lines[i] = []
-
-        floor_points = [1, 1, 2, 2, 2, 3, 3]
-        points_lost = sum(floor_points[:len(player.floor_line)])
-        player.score = max(0, player.score - points_lost)
-        self.discard.extend(player.floor_line)
-        player.floor_line = []
+                    valid_cols = self.valid_columns(player, i, color)
+                    col = (yield Decision(self, player.index, 'column', valid_cols, i, color)) if valid_cols else None
+                self.tile_line(player, i, col)
+        self.clear_floor(player)
+
+    def valid_columns(self, player, row, color):
+        # Free mode columns where the full pattern line's tile may go
+        return self.rules.open_cols[player.row_mask(row) | player.color_cols[color]]
+
+    def tile_line(self, player, row, col):
+        # Moves the full pattern line row to the wall at col and scores it,
+        # or to the floor line when col is None
+        p = player.index
+        color = player.pattern_colors[row]
+        if col is not None:
+            player.place_on_wall(row, col, color)
+            self.zobrist ^= WALL_KEYS[p][row * 5 + col][color]
+            self.score_tile(player, row, col)
+            self.discard[color] += row + 1
+        else:
+            floor_keys = FLOOR_KEYS[p][color]
+            self.zobrist ^= floor_keys[player.floor_counts[color]] ^ floor_keys[player.floor_counts[color] + row + 1]
+            player.floor_counts[color] += row + 1
+        self.zobrist ^= PATTERN_KEYS[p][row][color][row + 1]
+        player.pattern_colors[row] = None
+        player.pattern_counts[row] = 0
+
+    def clear_floor(self, player):
+        p = player.index
+        points_lost = self.rules.floor_points_lost(player.floor_size())
+        self.set_score(player, max(0, player.score - points_lost))
+        for color in range(len(player.floor_counts)):
+            self.zobrist ^= FLOOR_KEYS[p][color][player.floor_counts[color]]
+            self.discard[color] += player.floor_counts[color]
+            player.floor_counts[color] = 0
+        if player.floor_token:
+            self.zobrist ^= FLOOR_TOKEN_KEYS[p]
+        player.floor_token = False
+
+    def choose_column(self, player, row, color, valid_cols):
+        # Free mode wall placement is delegated to the player's CPU, or asked from a human
+        ai = self.ai[player.index]
+        if ai is not None:
+            return ai.choose_column(player, row, color, valid_cols)
+
+        print(f"Valid columns for {self.colors[color]} tile: {', '.join(map(str, [c+1 for c in valid_cols]))}")
+        while True:
+            col = input(f"Choose a column (1-5) for the {self.colors[color]} tile: ")
+            if col.isdigit() and int(col) - 1 in valid_cols:
+                return int(col) - 1
+            print("Invalid column. Please try again.")
+
+    def tile_points(self, player, row, col):
+        # Points a tile at (row, col) scores, whether or not it is already placed
+        row_runs = self.rules.row_runs
+        horizontal = row_runs[player.row_mask(row)][col]
+        vertical = row_runs[player.col_mask(col)][row]
+
+        # A lone tile scores 1, otherwise each connected line scores its length
+        if horizontal > 1 and vertical > 1:
+            return horizontal + vertical
+        return horizontal + vertical - 1
+
+    def set_score(self, player, score):
+        keys = SCORE_KEYS[player.index]
+        self.zobrist ^= keys[player.score] ^ keys[score]
+        player.score = score
 
     def score_tile(self, player, row, col):
-        score = 1
-        horizontal_connection = False
-        vertical_connection = False
-
-        # Check horizontal
-        left = right = col
-        while left > 0 and player.wall[row][left-1]:
-            left -= 1
-            score += 1
-            horizontal_connection = True
-        while right < 4 and player.wall[row][right+1]:
-            right += 1
-            score += 1
-            horizontal_connection = True
-        
-        # Check vertical
-        up = down = row
-        while up > 0 and player.wall[up-1][col]:
-            up -= 1
-            score += 1
-            vertical_connection = True
-        while down < 4 and player.wall[down+1][col]:
-            down += 1
-            score += 1
-            vertical_connection = True
-        
-        # Add extra point if connected both horizontally and vertically
-        if horizontal_connection and vertical_connection:
-            score += 1
-
-        player.score += score
+        points = self.tile_points(player, row, col)
+        self.set_score(player, player.score + points)
+        return points
 
     def reset_factories(self):
-        if not self.bag:
-            self.bag.extend([tile for tile in self.discard if tile.color != '1'])
-            self.discard.clear()
-            random.shuffle(self.bag)
+        if not any(self.bag):
+            for color in range(len(self.bag)):
+                self.bag[color] += self.discard[color]
+                self.discard[color] = 0
 
-        for factory in self.factories:
-            factory.tiles = [self.bag.pop() for _ in range(4) if self.bag]
-
-        self.center.tiles = [Tile('1')]
+        self.fill_factories()
 
     def end_game_scoring(self):
         for player in self.players:
-            player.score += 2 * sum(1 for row in player.wall if all(row))
-            player.score += 7 * sum(1 for col in range(5) if all(player.wall[row][col] for row in range(5)))
-            player.score += 10 * sum(1 for color in self.colors if all(player.wall[row][self.colors.index(color)] for row in range(5)))
-
-    def display_game_state(self):
-        print("\n" + "=" * 50)
-        print("Game State:")
-        print("=" * 50)
-
-        print("\nFactories:")
-        for factory in self.factories:
-            if factory.tiles:
-                print(f"{factory.name}: {' '.join(tile.color for tile in factory.tiles)}")
-        
-        if self.center.tiles:
-            print(f"\nCenter: {' '.join(tile.color for tile in self.center.tiles)}")
-        
-        for player in self.players:
-            self.display_player_board(player)
-
-        print("\n" + "=" * 50)
-
-    def display_player_board(self, player):
-        print(f"\n{player.name}'s Board:")
-        print("Pattern Lines:")
-        for i, line in enumerate(player.pattern_lines):
-            wall_row = ' '.join(tile if tile else '.' for tile in player.wall[i])
-            pattern_line = ' '.join(tile.color for tile in line)
-            empty_spaces = ' '.join('-' for _ in range(5 - (i + 1))) + ' ' if i < 4 else ''
-            print(f"{i+1}: {(empty_spaces + pattern_line).ljust(9)} | {wall_row}")
-        print(f"Floor Line: {' '.join(tile.color for tile in player.floor_line)}")
-        print(f"Score: {player.score}")
+            bonus = 2 * player.complete_rows + 7 * player.complete_cols + 10 * player.complete_cols
+            self.set_score(player, player.score + bonus)
 
     def play_game(self):
+        return self.run(self.decisions())
+
+    def decisions(self):
+        # The game loop as a generator. Each choice is yielded as a Decision
+        # and resumed with the answer sent back, so a driver can advance many
+        # games at once; play_game answers them with self.ai or the user.
+        # Returns the players.
         self.setup_game()
-        while not any(all(row) for player in self.players for row in player.wall):
-            if self.verbose:
-                print(f"\nRound {self.round_num}")
-            self.play_round()
-            self.end_round()
-            if self.verbose:
-                self.display_game_state()
+        while not any(player.has_complete_row() for player in self.players):
+            yield from self.round_decisions()
             self.round_num += 1
-        
-        self.end_game_scoring()
-        winner = max(self.players, key=lambda p: p.score)
+        return self.finish_game()
 
-        if self.verbose:
-            print(f"\nThe game has ended!")
-            for player in self.players:
-                print(f"{player.name} final score: {player.score}")
-            print(f"\nThe winner is {winner.name} with a score of {winner.score}!")
+    def round_decisions(self):
+        yield from self.turn_decisions()
+        yield from self.end_round_decisions()
 
+    def finish_game(self):
+        self.end_game_scoring()
         return self.players
+
+
+class ObservedAzulGame(AzulGame):
+    """AzulGame that reports what happens to its event sinks.
+
+    AzulGame.attach() switches a game to this class when the first sink is
+    attached. It only adds the events on top of the game logic, so a game
+    nobody observes never checks for sinks or builds events.
+    """
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink(self, event)
+
+    def move_decision(self, player):
+        self.emit(TurnStarted(player))
+        return super().move_decision(player)
+
+    def take_turn(self, player, move):
+        super().take_turn(player, move)
+        self.emit(TurnTaken(player, self.sources[move[0]], move[1], move[2]))
+
+    def tile_line(self, player, row, col):
+        if col is None:
+            self.emit(TilesFloored(player, row, player.pattern_colors[row]))
+        super().tile_line(player, row, col)
+
+    def score_tile(self, player, row, col):
+        points = super().score_tile(player, row, col)
+        self.emit(TileScored(player, row, col, points))
+        return points
+
+    def round_decisions(self):
+        self.emit(RoundStarted(self.round_num))
+        yield from super().round_decisions()
+        self.emit(RoundEnded(self.round_num))
+
+    def finish_game(self):
+        players = super().finish_game()
+        self.emit(GameOver(max(players, key=lambda p: p.score)))
+        return players
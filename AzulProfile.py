@@ -0,0 +1,125 @@
+import functools
+import time
+
+from AzulCPU import AzulCPU, TurnContext
+from AzulGame import AzulGame
+from AzulSearch import ISMCTS, MCTS, AlphaBeta
+
+# (phase, class, method) timed by the profiler. A phase only counts the time
+# not already spent in another timed method, so wall tiling excludes scoring.
+# Wall tiling is timed per pattern line and floor, the steps the game loop
+# runs for move_to_wall.
+PHASES = [
+    ("move_choice", AzulCPU, "choose_move"),
+    ("tile_taking", AzulGame, "take_turn"),
+    ("wall_tiling", AzulGame, "tile_line"),
+    ("wall_tiling", AzulGame, "clear_floor"),
+    ("scoring", AzulGame, "score_tile"),
+    ("scoring", AzulGame, "end_game_scoring"),
+    ("refill", AzulGame, "reset_factories"),
+]
+
+# (count, class, method, amount) counted by the profiler, amount giving
+# what one call adds from its arguments and result. The strategies try every
+# line lines() returns for the option they look at, and find_least_negative
+# tries every option on the floor. The searches count alpha-beta nodes and
+# MCTS playouts, whose rollouts also evaluate candidate moves.
+COUNTS = [
+    ("valid_lines_calls", AzulGame, "get_valid_lines", lambda args, result: 1),
+    ("candidate_moves", TurnContext, "lines", lambda args, result: len(result)),
+    ("candidate_moves", AzulCPU, "find_least_negative", lambda args, result: len(args[1].options)),
+    ("search_steps", AlphaBeta, "search", lambda args, result: 1),
+    ("search_steps", MCTS, "playout", lambda args, result: 1),
+    ("search_steps", ISMCTS, "playout", lambda args, result: 1),
+]
+
+
+class Profiler:
+    """Per-phase timing of the engine and the CPU strategies.
+
+    enable() swaps the timed methods on the classes for wrappers and
+    disable() puts the originals back, so nothing is checked or counted
+    while the profiler is off.
+    """
+
+    def __init__(self):
+        self.times = {phase: 0.0 for phase, _, _ in PHASES}
+        self.calls = {phase: 0 for phase, _, _ in PHASES}
+        self.counts = {count: 0 for count, _, _, _ in COUNTS}
+        self.child_time = 0.0
+        self.originals = []
+
+    def enable(self):
+        for phase, cls, name in PHASES:
+            self.patch(cls, name, self.timed(phase, cls.__dict__[name]))
+        for count, cls, name, amount in COUNTS:
+            self.patch(cls, name, self.counted(count, amount, cls.__dict__[name]))
+
+    def disable(self):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+
+    def patch(self, cls, name, wrapper):
+        self.originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, wrapper)
+
+    def timed(self, phase, function):
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            outer_child_time = self.child_time
+            self.child_time = 0.0
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                self.times[phase] += elapsed - self.child_time
+                self.calls[phase] += 1
+                self.child_time = outer_child_time + elapsed
+        return wrapper
+
+    def counted(self, count, amount, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            self.counts[count] += amount(args, result)
+            return result
+        return wrapper
+
+    def summary(self):
+        return {
+            "times": dict(self.times),
+            "calls": dict(self.calls),
+            "counts": dict(self.counts),
+        }
+
+
+def merge_summaries(summaries):
+    merged = Profiler().summary()
+    for summary in summaries:
+        for phase in merged["times"]:
+            merged["times"][phase] += summary["times"][phase]
+            merged["calls"][phase] += summary["calls"][phase]
+        for count in merged["counts"]:
+            merged["counts"][count] += summary["counts"][count]
+    return merged
+
+
+def format_summary(summary):
+    total = sum(summary["times"].values()) or 1.0
+    lines = [f"  {'phase':12} {'seconds':>9} {'share':>7} {'calls':>10} {'us/call':>9}"]
+    for phase, seconds in summary["times"].items():
+        calls = summary["calls"][phase]
+        per_call = seconds / calls * 1e6 if calls else 0.0
+        lines.append(f"  {phase:12} {seconds:9.3f} {seconds / total:7.1%} {calls:10d} {per_call:9.2f}")
+
+    decisions = summary["calls"]["move_choice"] or 1
+    counts = summary["counts"]
+    lines.append(f"  get_valid_lines calls per decision: {counts['valid_lines_calls'] / decisions:.2f}")
+    lines.append(f"  candidate moves evaluated per decision: {counts['candidate_moves'] / decisions:.2f}")
+    if counts["search_steps"]:
+        lines.append(f"  search nodes and playouts per decision: {counts['search_steps'] / decisions:.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,168 @@
+import os
+
+from AzulEvents import TileScored, TurnTaken
+from AzulGame import AzulGame
+
+LINE_CODES = 6  # pattern lines 0-4 and the floor line
+MODES = ['pattern', 'free']
+
+
+def encode_move(source, color, line, num_colors=5):
+    # source is an index, factories first and the center last; line -1 is the floor
+    return (source * num_colors + color) * LINE_CODES + line + 1
+
+
+def decode_move(code, num_colors=5):
+    source_color, line = divmod(code, LINE_CODES)
+    source, color = divmod(source_color, num_colors)
+    return source, color, line - 1
+
+
+def one_byte_codes(num_players, num_colors=5):
+    # With up to 3 players every move code fits in a byte, larger games use varints
+    return (num_players * 2 + 2) * num_colors * LINE_CODES <= 256
+
+
+def write_varint(out, value):
+    # Unsigned LEB128: 7 bits per byte, high bit set on all but the last byte
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class GameRecord:
+    """A game as its seed and the decisions taken in it.
+
+    codes is the sequence of decisions in the order the engine asked for
+    them: an encode_move code per turn and, in free mode, the wall column of
+    every tile placed at the end of a round. Replaying the codes from the
+    same seed reproduces the game exactly.
+    """
+
+    def __init__(self, seed, num_players=2, mode='pattern', codes=None):
+        self.seed = seed
+        self.num_players = num_players
+        self.mode = mode
+        self.codes = codes if codes is not None else []
+
+    def encode(self):
+        data = bytearray()
+        write_varint(data, self.seed)
+        write_varint(data, self.num_players)
+        write_varint(data, MODES.index(self.mode))
+        if one_byte_codes(self.num_players):
+            data += bytes(self.codes)
+        else:
+            for code in self.codes:
+                write_varint(data, code)
+        return bytes(data)
+
+    @classmethod
+    def decode(cls, data):
+        seed, pos = read_varint(data, 0)
+        num_players, pos = read_varint(data, pos)
+        mode, pos = read_varint(data, pos)
+        if one_byte_codes(num_players):
+            codes = list(data[pos:])
+        else:
+            codes = []
+            while pos < len(data):
+                code, pos = read_varint(data, pos)
+                codes.append(code)
+        return cls(seed, num_players, MODES[mode], codes)
+
+
+class GameRecorder:
+    """Event sink building the GameRecord of the game it is attached to."""
+
+    def __init__(self, game, seed):
+        self.record = GameRecord(seed, len(game.players), game.mode)
+
+    def __call__(self, game, event):
+        if isinstance(event, TurnTaken):
+            self.record.codes.append(encode_move(event.source.index, event.color, event.line, len(game.colors)))
+        elif isinstance(event, TileScored) and game.mode == 'free':
+            self.record.codes.append(event.col)
+
+
+def record_game(game, seed):
+    # Attaches a recorder to a game created with this seed and returns the
+    # record, which fills in as the game is played
+    recorder = GameRecorder(game, seed)
+    game.attach(recorder)
+    return recorder.record
+
+
+class ReplayController:
+    """Stands in for every player's CPU and answers with the recorded decisions."""
+
+    def __init__(self, game, codes):
+        self.game = game
+        self.codes = iter(codes)
+
+    def choose_move(self):
+        source, color, line = decode_move(next(self.codes), len(self.game.colors))
+        return self.game.sources[source], color, line
+
+    def choose_column(self, player, row, color, valid_cols):
+        return next(self.codes)
+
+
+def replay(record, verbose=False):
+    # Re-plays a record through AzulGame and returns the finished game
+    game = AzulGame(record.num_players, mode=record.mode, verbose=verbose, seed=record.seed)
+    controller = ReplayController(game, record.codes)
+    game.ai = [controller] * record.num_players
+    game.play_game()
+    return game
+
+
+def write_records(out, records):
+    # Records are stored back to back, each prefixed by its length
+    data = bytearray()
+    for record in records:
+        encoded = record.encode()
+        write_varint(data, len(encoded))
+        data += encoded
+    out.write(data)
+
+
+def read_records(path):
+    # Yields the records of a file, ignoring a partly written last record
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    pos = 0
+    while pos < len(data):
+        try:
+            length, start = read_varint(data, pos)
+        except IndexError:
+            return
+        if start + length > len(data):
+            return
+        yield GameRecord.decode(data[start:start + length])
+        pos = start + length
+
+
+def keep_records(path, seeds):
+    # Rewrites a record file with only the first record of each game whose
+    # seed is in seeds, dropping repeats and games of other runs
+    seeds = set(seeds)
+    with open(path + '.tmp', 'wb') as out:
+        for record in read_records(path):
+            if record.seed in seeds:
+                seeds.remove(record.seed)
+                write_records(out, [record])
+    os.replace(path + '.tmp', path)
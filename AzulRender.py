@@ -0,0 +1,86 @@
+import sys
+
+from AzulEvents import GameOver, RoundEnded, RoundStarted, TilesFloored, TurnStarted, TurnTaken
+
+
+def format_tiles(game, source):
+    tiles = ' '.join(game.colors[color] for color, count in enumerate(source.counts) for _ in range(count))
+    return '1 ' + tiles if source.first_player_token else tiles
+
+
+def format_options(game):
+    lines = ["\nAvailable factories:"]
+    for factory in game.factories:
+        if not factory.is_empty():
+            lines.append(f"{factory.name}: {format_tiles(game, factory)}")
+
+    if game.center.size():
+        lines.append(f"Center: {format_tiles(game, game.center)}")
+    return lines
+
+
+def format_player_board(game, player):
+    lines = [f"\n{player.name}'s Board:", "Pattern Lines:"]
+    wall = player.wall
+    for i, count in enumerate(player.pattern_counts):
+        wall_row = ' '.join(game.colors[tile] if tile is not None else '.' for tile in wall[i])
+        pattern_line = ' '.join(game.colors[player.pattern_colors[i]] for _ in range(count))
+        empty_spaces = ' '.join('-' for _ in range(5 - (i + 1))) + ' ' if i < 4 else ''
+        lines.append(f"{i+1}: {(empty_spaces + pattern_line).ljust(9)} | {wall_row}")
+    floor_line = ' '.join(game.colors[color] for color, count in enumerate(player.floor_counts) for _ in range(count))
+    lines.append(f"Floor Line: {'1 ' + floor_line if player.floor_token else floor_line}")
+    lines.append(f"Score: {player.score}")
+    return lines
+
+
+def format_game_state(game):
+    lines = ["\n" + "=" * 50, "Game State:", "=" * 50, "\nFactories:"]
+    for factory in game.factories:
+        if not factory.is_empty():
+            lines.append(f"{factory.name}: {format_tiles(game, factory)}")
+
+    if game.center.size():
+        lines.append(f"\nCenter: {format_tiles(game, game.center)}")
+
+    for player in game.players:
+        lines.extend(format_player_board(game, player))
+
+    lines.append("\n" + "=" * 50)
+    return lines
+
+
+def write_frame(lines, out=None):
+    # One write per frame instead of one per line
+    out = out or sys.stdout
+    out.write('\n'.join(lines) + '\n')
+    out.flush()
+
+
+class TerminalRenderer:
+    """Event sink drawing a game on the terminal, one buffered frame per event."""
+
+    def __init__(self, out=None):
+        self.out = out
+
+    def __call__(self, game, event):
+        if isinstance(event, TurnStarted):
+            lines = format_game_state(game) + [f"\n{event.player.name}'s turn"]
+        elif isinstance(event, TurnTaken):
+            lines = [f"{event.player.name} chose {event.source.name} and color {game.colors[event.color]}"]
+            if event.line != -1:
+                lines.append(f"{event.player.name} placed tiles on Pattern Line {event.line + 1}")
+            else:
+                lines.append(f"{event.player.name} placed tiles on the Floor Line")
+        elif isinstance(event, RoundStarted):
+            lines = [f"\nRound {event.round_num}"]
+        elif isinstance(event, RoundEnded):
+            lines = format_game_state(game)
+        elif isinstance(event, TilesFloored):
+            lines = [f"No valid columns for {game.colors[event.color]} tile. Moving to floor line."]
+        elif isinstance(event, GameOver):
+            lines = ["\nThe game has ended!"]
+            lines.extend(f"{player.name} final score: {player.score}" for player in game.players)
+            lines.append(f"\nThe winner is {event.winner.name} with a score of {event.winner.score}!")
+        else:
+            return
+        write_frame(lines, self.out)
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+
+
+class ResultsStore:
+    """Append-only JSON Lines log of finished simulation chunks.
+
+    Each line records one chunk: its matchup, game mode, seed, game range,
+    engine and aggregated outcomes. Lines are flushed as soon as they are
+    written and fsynced at most every fsync_interval seconds, so a crash
+    loses at most the chunks that were still running.
+    """
+
+    def __init__(self, path, resume=False, fsync_interval=5.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.records = {}
+
+        if resume and os.path.exists(path):
+            self.load()
+            self.file = open(path, 'a')
+        else:
+            self.file = open(path, 'w')
+        self.last_fsync = time.monotonic()
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        # A crash can leave a partly written last line, or whole lines of
+        # garbage such as NUL blocks where the file system lost the data.
+        # Everything from the first line that does not parse is dropped
+        # before appending, so the log stays a clean prefix of the run.
+        complete = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    key = chunk_key(record)
+                except (ValueError, KeyError, TypeError):
+                    break
+                self.records[key] = record
+            complete += len(line)
+        if complete < len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def append(self, first_strategy, second_strategy, mode, seed, start, num_games, engine, results, total_scores, diff_sq):
+        record = {
+            "first": first_strategy,
+            "second": second_strategy,
+            "mode": mode,
+            "seed": seed,
+            "start": start,
+            "games": num_games,
+            "engine": engine,
+            "wins": results[0],
+            "losses": results[1],
+            "ties": results[2],
+            "score_first": total_scores[0],
+            "score_second": total_scores[1],
+            "diff_sq": diff_sq,
+        }
+        self.records[chunk_key(record)] = record
+
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        if time.monotonic() - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_fsync = time.monotonic()
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+def chunk_key(record):
+    return (record["first"], record["second"], record["mode"], record["seed"], record["start"], record["games"], record["engine"])
+
+
+def merge_results(records, path="results.json", reports=None):
+    # Folds chunk records into the results.json schema, keeping matchups
+    # from earlier runs that these records do not cover. reports adds extra
+    # fields per matchup, such as the stopping rule's intervals.
+    totals = {}
+    for record in records:
+        total = totals.setdefault((record["first"], record["second"]), [0, 0, 0, 0, 0, 0])
+        for i, field in enumerate(["wins", "losses", "ties", "score_first", "score_second", "games"]):
+            total[i] += record[field]
+
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+    else:
+        data = {}
+
+    for (first_strategy, second_strategy), (wins, losses, ties, score_first, score_second, games) in totals.items():
+        data.setdefault(first_strategy, {})[second_strategy] = {
+            "wins": wins,
+            "losses": losses,
+            "ties": ties,
+            "avg_first": score_first / games,
+            "avg_second": score_second / games,
+            **(reports or {}).get((first_strategy, second_strategy), {}),
+        }
+
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4)
@@ -0,0 +1,93 @@
+COLORS = ('R', 'B', 'Y', 'K', 'W')  # Red, Blue, Yellow, blacK, White
+
+WALL_PATTERN = (
+    ('B', 'Y', 'R', 'K', 'W'),
+    ('W', 'B', 'Y', 'R', 'K'),
+    ('K', 'W', 'B', 'Y', 'R'),
+    ('R', 'K', 'W', 'B', 'Y'),
+    ('Y', 'R', 'K', 'W', 'B'),
+)
+
+BOARD_SIZE = 5
+FULL_LINE = 0b11111
+TILES_PER_COLOR = 20
+TILES_PER_FACTORY = 4
+FLOOR_POINTS = (1, 1, 2, 2, 2, 3, 3)  # points lost by each floor line slot
+
+
+def _row_runs():
+    # runs[mask][i] is the length of the run of set bits through bit i of a
+    # 5-bit line mask, counting bit i itself as set
+    runs = []
+    for mask in range(1 << BOARD_SIZE):
+        row = []
+        for i in range(BOARD_SIZE):
+            left = right = i
+            while left > 0 and mask >> (left - 1) & 1:
+                left -= 1
+            while right < BOARD_SIZE - 1 and mask >> (right + 1) & 1:
+                right += 1
+            row.append(right - left + 1)
+        runs.append(tuple(row))
+    return tuple(runs)
+
+
+# ROW_RUNS is used both for wall rows and, through the transposed mask, for
+# wall columns
+ROW_RUNS = _row_runs()
+
+
+class Rules:
+    """Lookup tables for the rules of one game mode.
+
+    Built once per mode and shared by every game, so the engine and the CPUs
+    only index into tables. Instances are read-only and pickle as their mode.
+    """
+
+    __slots__ = ('mode', 'colors', 'color_index', 'wall_cols', 'open_cols', 'floor_penalty', 'row_runs',
+                 'row_neighbors', 'col_neighbors', 'bag', 'tiles_per_factory')
+
+    def __init__(self, mode):
+        self._set('mode', mode)
+        self._set('colors', COLORS)
+        self._set('color_index', {color: i for i, color in enumerate(COLORS)})
+        if mode == 'pattern':
+            # wall_cols[row][color] is the column where that color goes in the row
+            self._set('wall_cols', tuple(tuple(row.index(color) for color in COLORS) for row in WALL_PATTERN))
+        else:
+            self._set('wall_cols', None)
+        # open_cols[mask] lists the columns whose bit is clear in a 5-bit mask of
+        # blocked columns, the free mode choices for a tile
+        self._set('open_cols', tuple(tuple(col for col in range(BOARD_SIZE) if not mask >> col & 1) for mask in range(1 << BOARD_SIZE)))
+        # floor_penalty[n] is the total lost for n floor tiles, the last entry
+        # standing for a full floor line and beyond
+        self._set('floor_penalty', tuple(sum(FLOOR_POINTS[:n]) for n in range(len(FLOOR_POINTS) + 1)))
+        self._set('row_runs', ROW_RUNS)
+        # Wall mask bits next to each cell (row * 5 + col), within its row and within its column
+        cells = range(BOARD_SIZE * BOARD_SIZE)
+        self._set('row_neighbors', tuple(sum(1 << (cell + d) for d in (-1, 1) if 0 <= cell % BOARD_SIZE + d < BOARD_SIZE) for cell in cells))
+        self._set('col_neighbors', tuple(sum(1 << (cell + d) for d in (-BOARD_SIZE, BOARD_SIZE) if 0 <= cell + d < BOARD_SIZE * BOARD_SIZE) for cell in cells))
+        self._set('bag', (TILES_PER_COLOR,) * len(COLORS))  # tiles of each color in a new game
+        self._set('tiles_per_factory', TILES_PER_FACTORY)
+
+    def _set(self, name, value):
+        object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Rules are read-only")
+
+    def __reduce__(self):
+        return get_rules, (self.mode,)
+
+    def factory_count(self, num_players):
+        return num_players * 2 + 1
+
+    def floor_points_lost(self, floor_size):
+        return self.floor_penalty[min(floor_size, len(self.floor_penalty) - 1)]
+
+
+RULES = {mode: Rules(mode) for mode in ('pattern', 'free')}
+
+
+def get_rules(mode):
+    return RULES[mode]
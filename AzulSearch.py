@@ -0,0 +1,500 @@
+import math
+import random
+import time
+
+from AzulRules import FULL_LINE
+
+PARTIAL_CREDIT = 0.5  # value of a tile left on an unfinished pattern line
+MOVE_TIME = 0.2  # seconds per mcts and ismcts move of the play levels, at most
+
+EXACT, LOWER, UPPER = 0, 1, 2
+ROUND_END = 1 << 30  # stored depth of results searched to the end of the round
+
+
+def line_points(row_runs, mask, mask_t, row, col):
+    # Same as AzulGame.tile_points, on bare wall masks
+    horizontal = row_runs[mask >> (row * 5) & FULL_LINE][col]
+    vertical = row_runs[mask_t >> (col * 5) & FULL_LINE][row]
+    if horizontal > 1 and vertical > 1:
+        return horizontal + vertical
+    return horizontal + vertical - 1
+
+
+def round_end_scores(game):
+    # Scores the players would have if the round ended now: full pattern
+    # lines tiled and scored, floor penalties applied and, if a row gets
+    # completed, the end game bonuses. Free mode tiles go to their highest
+    # scoring column. Tiles on unfinished lines get partial credit unless
+    # the game ends.
+    rules = game.rules
+    scores = []
+    partials = []
+    walls = []
+    game_over = False
+    for player in game.players:
+        mask, mask_t = player.wall_mask, player.wall_mask_t
+        color_cols = list(player.color_cols)
+        score = player.score
+        floor = player.floor_size()
+        partial = 0
+        for row in range(5):
+            count = player.pattern_counts[row]
+            if count == row + 1:
+                color = player.pattern_colors[row]
+                if game.wall_cols:
+                    col = game.wall_cols[row][color]
+                else:
+                    free = rules.open_cols[(mask >> (row * 5) & FULL_LINE) | color_cols[color]]
+                    if not free:
+                        floor += count
+                        continue
+                    col = max(free, key=lambda c: (line_points(rules.row_runs, mask, mask_t, row, c), -c))
+                score += line_points(rules.row_runs, mask, mask_t, row, col)
+                mask |= 1 << (row * 5 + col)
+                mask_t |= 1 << (col * 5 + row)
+                color_cols[color] |= 1 << col
+                if mask >> (row * 5) & FULL_LINE == FULL_LINE:
+                    game_over = True
+            else:
+                partial += count
+        scores.append(max(0, score - rules.floor_points_lost(floor)))
+        partials.append(partial)
+        walls.append((mask, mask_t, color_cols))
+
+    if not game_over:
+        return [score + PARTIAL_CREDIT * partial for score, partial in zip(scores, partials)]
+
+    for i, (mask, mask_t, _) in enumerate(walls):
+        scores[i] += 2 * sum(1 for row in range(5) if mask >> (row * 5) & FULL_LINE == FULL_LINE)
+        scores[i] += 7 * sum(1 for col in range(5) if mask_t >> (col * 5) & FULL_LINE == FULL_LINE)
+        scores[i] += 10 * sum(1 for col in range(5) if mask_t >> (col * 5) & FULL_LINE == FULL_LINE)
+    return scores
+
+
+def move_waste(game, move):
+    # Sort key putting the moves that waste the fewest tiles on the floor
+    # first, then the ones placing the most tiles
+    source, color, line = move
+    taken = game.sources[source].counts[color]
+    if line == -1:
+        return taken, 0
+    placed = min(taken, line + 1 - game.players[game.active_player].pattern_counts[line])
+    return taken - placed, -placed
+
+
+def tree_moves(game):
+    # Distinct legal moves without the floor line moves of tiles that fit a
+    # pattern line, which are almost never worth a tree node
+    moves = game.legal_moves(unique=True)
+    placeable = {(source, color) for source, color, line in moves if line != -1}
+    return [move for move in moves if move[2] != -1 or move[:2] not in placeable]
+
+
+def greedy_cpu(game):
+    # A greedy AzulCPU on game, for rollouts and free mode wall columns.
+    # AzulCPU imports this module, so it is imported here on first use.
+    from AzulCPU import AzulCPU
+
+    return AzulCPU(game, 'greedy')
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBeta:
+    """Iterative deepening alpha-beta over the moves left in the round.
+
+    The factories are known for the whole round, so searching to the round
+    end is exact. Opponents are treated as one coalition minimizing the
+    root player's lead over the best of them (paranoid search), which is
+    plain minimax with two players. Results are cached in a fixed-size
+    transposition table indexed by the game's Zobrist hash, replacing
+    entries from older searches or shallower depths.
+    """
+
+    def __init__(self, game, heuristic=None, max_nodes=5000, max_time=None, table_bits=16):
+        self.game = game
+        self.heuristic = heuristic  # callable returning a (source, color, line) move to try first
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.table = [None] * (1 << table_bits)
+        self.table_mask = len(self.table) - 1
+        self.generation = 0
+
+    def choose_move(self):
+        game = self.game
+        self.root = game.active_player
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.max_time if self.max_time else None
+        self.generation += 1
+
+        moves = game.legal_moves(unique=True)
+        best_move = self.heuristic_move() or moves[0]
+        if len(moves) == 1:
+            return best_move
+
+        depth = 1
+        while True:
+            self.cutoffs = 0
+            try:
+                _, move = self.search(depth, float('-inf'), float('inf'))
+            except SearchTimeout:
+                break
+            best_move = move
+            # A search that never hit the depth limit saw every line to the round end
+            if not self.cutoffs:
+                break
+            depth += 1
+        return best_move
+
+    def heuristic_move(self):
+        if self.heuristic is None:
+            return None
+        source, color, line = self.heuristic()
+        return source.index, color, line
+
+    def evaluate(self):
+        scores = round_end_scores(self.game)
+        root = scores[self.root]
+        return root - max(score for i, score in enumerate(scores) if i != self.root)
+
+    def ordered_moves(self, moves, first_moves):
+        game = self.game
+        moves = sorted(moves, key=lambda move: move_waste(game, move))
+        for move in reversed(first_moves):
+            if move in moves:
+                moves.remove(move)
+                moves.insert(0, move)
+        return moves
+
+    def search(self, depth, alpha, beta):
+        # Returns (value for the root player, best move)
+        game = self.game
+        self.nodes += 1
+        if (self.max_nodes and self.nodes > self.max_nodes) or (self.deadline and not self.nodes & 255 and time.perf_counter() > self.deadline):
+            raise SearchTimeout
+
+        moves = game.legal_moves(unique=True)
+        if not moves:
+            return self.evaluate(), None
+        if depth == 0:
+            self.cutoffs += 1
+            return self.evaluate(), None
+
+        key = game.state_hash()
+        slot = key & self.table_mask
+        entry = self.table[slot]
+        first_moves = []
+        if entry and entry[0] == key:
+            _, entry_depth, value, bound, entry_move, _ = entry
+            if entry_depth >= depth and (bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha)):
+                if entry_depth != ROUND_END:
+                    self.cutoffs += 1
+                return value, entry_move
+            first_moves.append(entry_move)
+        if depth > 1:
+            first_moves.append(self.heuristic_move())
+
+        cutoffs = self.cutoffs
+        maximizing = game.active_player == self.root
+        best_value = float('-inf') if maximizing else float('inf')
+        best_move = None
+        original_alpha, original_beta = alpha, beta
+        for move in self.ordered_moves(moves, first_moves):
+            undo_token = game.apply_move(move)
+            try:
+                value, _ = self.search(depth - 1, alpha, beta)
+            finally:
+                game.undo_move(undo_token)
+
+            if maximizing:
+                if value > best_value:
+                    best_value, best_move = value, move
+                    alpha = max(alpha, value)
+            elif value < best_value:
+                best_value, best_move = value, move
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            bound = UPPER
+        elif best_value >= original_beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        stored_depth = depth if self.cutoffs > cutoffs else ROUND_END
+        if entry is None or entry[5] != self.generation or entry[1] <= stored_depth:
+            self.table[slot] = (key, stored_depth, best_value, bound, best_move, self.generation)
+        return best_value, best_move
+
+
+class Node:
+    __slots__ = ("move", "parent", "player", "children", "untried", "visits", "value")
+
+    def __init__(self, move, parent, player, untried):
+        self.move = move
+        self.parent = parent
+        self.player = player  # who played move, the node's value is from their side
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.value = 0.0
+
+
+class MCTS:
+    """UCT search over the moves left in the round.
+
+    Each playout descends the tree, expands one move, finishes the round
+    with the rollout policy and scores it with round_end_scores. Moves are
+    played and taken back in place with apply_move/undo_move. Every node
+    keeps the value of the player who moved into it, so with more than two
+    players each player maximizes their own lead (max-n). Untried moves are
+    expanded in move_waste order, least waste first.
+    """
+
+    def __init__(self, game, rollout=None, playouts=1000, max_time=None, exploration=0.7, reward_scale=5.0, seed=0):
+        self.game = game
+        self.rollout = rollout  # callable returning a (source, color, line) move, None for uniform random
+        self.playouts = playouts
+        self.max_time = max_time
+        self.exploration = exploration
+        self.reward_scale = reward_scale  # points of lead worth about a 73% reward
+        # A generator of its own, so searching never touches the game's tile draws
+        self.rng = random.Random(seed)
+
+    def new_node(self, move, parent, player):
+        game = self.game
+        untried = sorted(tree_moves(game), key=lambda move: move_waste(game, move), reverse=True)
+        return Node(move, parent, player, untried)
+
+    def choose_move(self):
+        visits = self.root_visits()
+        return max(visits, key=visits.get)
+
+    def root_visits(self):
+        # Searches the position and returns the visit count of each root move
+        root = self.new_node(None, None, None)
+        if len(root.untried) == 1:
+            return {root.untried[0]: 1}
+
+        deadline = time.perf_counter() + self.max_time if self.max_time else None
+        playouts = 0
+        while (not self.playouts or playouts < self.playouts) and (not deadline or time.perf_counter() < deadline):
+            self.playout(root)
+            playouts += 1
+            if not self.playouts and not deadline:
+                break
+
+        return {child.move: child.visits for child in root.children}
+
+    def playout(self, root):
+        game = self.game
+        undo_tokens = []
+        node = root
+
+        # Selection
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            exploration = self.exploration
+            node = max(node.children, key=lambda child: child.value / child.visits + exploration * math.sqrt(log_visits / child.visits))
+            undo_tokens.append(game.apply_move(node.move))
+
+        # Expansion
+        if node.untried:
+            move = node.untried.pop()
+            player = game.active_player
+            undo_tokens.append(game.apply_move(move))
+            child = self.new_node(move, node, player)
+            node.children.append(child)
+            node = child
+
+        # Rollout to the end of the round
+        while not game.round_over():
+            if self.rollout:
+                source, color, line = self.rollout()
+                move = (source.index, color, line)
+            else:
+                move = self.rng.choice(game.legal_moves())
+            undo_tokens.append(game.apply_move(move))
+
+        rewards = self.rewards()
+        for undo_token in reversed(undo_tokens):
+            game.undo_move(undo_token)
+
+        # Backpropagation
+        while node is not None:
+            node.visits += 1
+            if node.player is not None:
+                node.value += rewards[node.player]
+            node = node.parent
+
+    def rewards(self):
+        return self.score_rewards(round_end_scores(self.game))
+
+    def score_rewards(self, scores):
+        # Each player's lead over the best opponent, squashed into 0-1
+        rewards = []
+        for i, score in enumerate(scores):
+            lead = score - max(other for j, other in enumerate(scores) if j != i)
+            rewards.append(1 / (1 + math.exp(-lead / self.reward_scale)))
+        return rewards
+
+
+class InfoNode:
+    __slots__ = ("player", "children", "visits", "value", "available")
+
+    def __init__(self, player):
+        self.player = player  # who played the move leading here
+        self.children = {}  # move -> InfoNode
+        self.visits = 0
+        self.value = 0.0
+        self.available = 0  # playouts in which the move leading here was legal
+
+
+class ISMCTS(MCTS):
+    """Information set MCTS looking one round past the current one.
+
+    The current round's factories are known, but the next round's draws
+    from the bag are not. Each playout searches a copy of the game whose
+    refill is drawn from the searcher's own generator: a determinization
+    consistent with the public tile counts of the bag and the discard. The
+    tree is shared by all determinizations. A node stands for the moves
+    played so far, and selection only considers moves legal in the
+    current determinization, weighted by how often each was available.
+    """
+
+    def __init__(self, game, rollout='greedy', playouts=1000, max_time=None, exploration=0.7, reward_scale=5.0, seed=0):
+        super().__init__(game, None, playouts, max_time, exploration, reward_scale, seed)
+        self.rollout_policy = rollout  # 'greedy' or 'random'
+
+    def root_visits(self):
+        moves = tree_moves(self.game)
+        if len(moves) == 1:
+            return {moves[0]: 1}
+
+        root = InfoNode(None)
+        deadline = time.perf_counter() + self.max_time if self.max_time else None
+        playouts = 0
+        while (not self.playouts or playouts < self.playouts) and (not deadline or time.perf_counter() < deadline):
+            self.playout(root)
+            playouts += 1
+            if not self.playouts and not deadline:
+                break
+
+        return {move: child.visits for move, child in root.children.items()}
+
+    def determinize(self):
+        game = self.game.clone()
+        game.rng = self.rng
+        # Rollouts and free mode wall columns are played by a greedy CPU on the copy
+        cpu = greedy_cpu(game)
+        game.ai = [cpu] * len(game.players)
+        return game, cpu
+
+    def playout(self, root):
+        game, cpu = self.determinize()
+        exploration = self.exploration
+        node = root
+        path = [root]
+        rounds_left = 2
+
+        while True:
+            if game.round_over():
+                rounds_left -= 1
+                if rounds_left == 0:
+                    break
+                game.end_round()
+                if any(player.has_complete_row() for player in game.players):
+                    break
+                game.round_num += 1
+                game.active_player = game.first_player_token
+                continue
+
+            if node is None:
+                # Rollout
+                if self.rollout_policy == 'greedy':
+                    source, color, line = cpu.greedy_algorithm()
+                    move = (source.index, color, line)
+                else:
+                    move = self.rng.choice(game.legal_moves())
+            else:
+                moves = tree_moves(game)
+                untried = [move for move in moves if move not in node.children]
+                player = game.active_player
+                if untried:
+                    # Expansion, then the rest of the playout is a rollout
+                    move = min(untried, key=lambda move: move_waste(game, move))
+                    node.children[move] = InfoNode(player)
+                    path.append(node.children[move])
+                    node = None
+                else:
+                    # Selection among the moves legal in this determinization
+                    children = [(move, node.children[move]) for move in moves]
+                    for _, child in children:
+                        child.available += 1
+                    move, node = max(children, key=lambda item: item[1].value / item[1].visits
+                                     + exploration * math.sqrt(math.log(item[1].available) / item[1].visits))
+                    path.append(node)
+            game.apply_move(move)
+
+        if any(player.has_complete_row() for player in game.players):
+            game.end_game_scoring()
+            scores = [player.score for player in game.players]
+        else:
+            scores = round_end_scores(game)
+        rewards = self.score_rewards(scores)
+
+        for node in path:
+            node.visits += 1
+            if node.player is not None:
+                node.value += rewards[node.player]
+
+
+def search_root_visits(game, algorithm, rollout, playouts, max_time, seed):
+    # Runs one independent search in a pool worker, on the game copy it was sent
+    cpu = greedy_cpu(game)
+    game.ai = [cpu] * len(game.players)
+    if algorithm == 'mcts':
+        search = MCTS(game, cpu.greedy_algorithm if rollout == 'greedy' else None, playouts, max_time, seed=seed)
+    else:
+        search = ISMCTS(game, rollout, playouts, max_time, seed=seed)
+    return search.root_visits()
+
+
+class RootParallel:
+    """Root parallel MCTS or ISMCTS over a process pool.
+
+    Every worker grows its own tree from the current position with its own
+    seed, and the root visit counts are summed to pick the move. The pool
+    is owned by the caller, so it is started once and reused for every move.
+    """
+
+    def __init__(self, game, algorithm, pool, workers, rollout='greedy', playouts=None, max_time=MOVE_TIME):
+        self.game = game
+        self.algorithm = algorithm
+        self.pool = pool
+        self.workers = workers
+        self.rollout = rollout
+        self.playouts = playouts
+        self.max_time = max_time
+        self.searches = 0
+
+    def choose_move(self):
+        # Workers get the state only: no CPUs, and no random generator to peek at
+        state = self.game.clone()
+        state.ai = None
+        state.rng = None
+        self.searches += 1
+
+        futures = [
+            self.pool.submit(search_root_visits, state, self.algorithm, self.rollout, self.playouts, self.max_time,
+                             self.searches * self.workers + worker)
+            for worker in range(self.workers)
+        ]
+        visits = {}
+        for future in futures:
+            for move, count in future.result().items():
+                visits[move] = visits.get(move, 0) + count
+        return max(visits, key=visits.get)
@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+from AzulGame import AzulGame
+from AzulZobrist import ACTIVE_PLAYER_KEYS, FIRST_PLAYER_KEYS
+
+PlayerState = namedtuple('PlayerState', 'pattern_colors pattern_counts color_masks floor_counts floor_token score')
+
+
+class GameState(namedtuple('GameState', 'mode sources center_token players bag discard round_num active_player first_player_token key')):
+    """Immutable snapshot of an AzulGame, usable as a dict key.
+
+    Everything is held in tuples: sources is the tile counts of every
+    source (factories first, the center last) and players a PlayerState
+    per player. key is the game's state_hash(), which also serves as the
+    hash, so hashing a state never walks it. The random generator is not
+    part of the state.
+    """
+
+    __slots__ = ()
+
+    def __hash__(self):
+        return self.key
+
+
+def _share(new, old):
+    # Tuple equal to new that reuses old, or the items of old, wherever they
+    # are equal, so successive states hold the same objects for the parts
+    # that did not change
+    if new == old:
+        return old
+    return tuple([o if n == o else n for n, o in zip(new, old)])
+
+
+def player_state(player, previous=None):
+    state = PlayerState(tuple(player.pattern_colors), tuple(player.pattern_counts), tuple(player.color_masks),
+                        tuple(player.floor_counts), player.floor_token, player.score)
+    if previous is None:
+        return state
+    return previous if state == previous else PlayerState._make(_share(state, previous))
+
+
+def snapshot(game, previous=None):
+    # State of the game now. Given the state of an earlier position of the
+    # same game, its sources and boards are reused wherever they did not change.
+    sources = tuple([tuple(source.counts) for source in game.sources])
+    bag, discard = tuple(game.bag), tuple(game.discard)
+    if previous is None:
+        players = tuple([player_state(player) for player in game.players])
+    else:
+        sources = _share(sources, previous.sources)
+        players = _share(tuple([player_state(player, old) for player, old in zip(game.players, previous.players)]), previous.players)
+        bag, discard = _share(bag, previous.bag), _share(discard, previous.discard)
+
+    return GameState(game.mode, sources, game.center.first_player_token, players, bag, discard,
+                     game.round_num, game.active_player, game.first_player_token, game.state_hash())
+
+
+def restore(state, seed=None):
+    # A new AzulGame in the snapshotted position, with dummy CPUs and a random
+    # generator seeded afresh
+    game = AzulGame(len(state.players), mode=state.mode, verbose=False, seed=seed)
+    for source, counts in zip(game.sources, state.sources):
+        source.counts = list(counts)
+    game.center.first_player_token = state.center_token
+
+    for player, player_state in zip(game.players, state.players):
+        player.pattern_colors = list(player_state.pattern_colors)
+        player.pattern_counts = list(player_state.pattern_counts)
+        for color, mask in enumerate(player_state.color_masks):
+            for cell in range(25):
+                if mask >> cell & 1:
+                    player.place_on_wall(cell // 5, cell % 5, color)
+        player.floor_counts = list(player_state.floor_counts)
+        player.floor_token = player_state.floor_token
+        player.score = player_state.score
+
+    game.bag = list(state.bag)
+    game.discard = list(state.discard)
+    game.round_num = state.round_num
+    game.active_player = state.active_player
+    game.first_player_token = state.first_player_token
+    game.zobrist = state.key ^ ACTIVE_PLAYER_KEYS[state.active_player] ^ FIRST_PLAYER_KEYS[state.first_player_token]
+    return game
@@ -0,0 +1,95 @@
+import abc
+import math
+from statistics import NormalDist
+
+
+class MatchupTotals:
+    """Running aggregates of the games played so far in one matchup."""
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.losses = 0
+        self.ties = 0
+        self.score_first = 0
+        self.score_second = 0
+        self.diff_sq = 0  # sum of squared per-game score differences
+
+    def add(self, record):
+        self.games += record["games"]
+        self.wins += record["wins"]
+        self.losses += record["losses"]
+        self.ties += record["ties"]
+        self.score_first += record["score_first"]
+        self.score_second += record["score_second"]
+        self.diff_sq += record["diff_sq"]
+
+    def win_rate_interval(self, z):
+        # Wilson score interval. Ties count as half a win, and taking the
+        # variance of a plain win or loss, p(1 - p), keeps it conservative
+        # with them. Unlike the normal approximation it does not collapse to
+        # a point when one side wins every game.
+        n = self.games
+        mean = (self.wins + 0.5 * self.ties) / n
+        z2 = z * z / n
+        center = (mean + z2 / 2) / (1 + z2)
+        half_width = z * math.sqrt(mean * (1 - mean) / n + z2 / (4 * n)) / (1 + z2)
+        return center - half_width, center + half_width
+
+    def score_diff_interval(self, z):
+        n = self.games
+        mean = (self.score_first - self.score_second) / n
+        variance = max(0.0, self.diff_sq / n - mean * mean) * n / max(1, n - 1)
+        half_width = z * math.sqrt(variance / n)
+        return mean - half_width, mean + half_width
+
+
+class SequentialTest(abc.ABC):
+    """Base class for rules that stop a matchup once it is statistically decided."""
+
+    def __init__(self, alpha=0.05):
+        self.alpha = alpha
+        self.z = NormalDist().inv_cdf(1 - alpha / 2)
+
+    @abc.abstractmethod
+    def decided(self, totals):
+        """Whether the matchup can stop after the games in totals."""
+
+    def report(self, totals):
+        return {
+            "games": totals.games,
+            "win_rate_ci": list(totals.win_rate_interval(self.z)),
+            "score_diff_ci": list(totals.score_diff_interval(self.z)),
+        }
+
+
+class SPRT(SequentialTest):
+    """Wald's sequential probability ratio test on the first player's share
+    of decisive games, between p = 0.5 - delta and p = 0.5 + delta."""
+
+    def __init__(self, delta=0.02, alpha=0.05, beta=0.05):
+        super().__init__(alpha)
+        self.win_step = math.log((0.5 + delta) / (0.5 - delta))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+
+    def decided(self, totals):
+        llr = (totals.wins - totals.losses) * self.win_step
+        return llr >= self.upper or llr <= self.lower
+
+
+class ConfidenceWidth(SequentialTest):
+    """Stops once the confidence intervals of the win rate and of the mean
+    score difference are both narrower than the targets (half-widths)."""
+
+    def __init__(self, win_rate_width=0.01, score_width=0.5, alpha=0.05):
+        super().__init__(alpha)
+        self.win_rate_width = win_rate_width
+        self.score_width = score_width
+
+    def decided(self, totals):
+        if totals.games < 2:
+            return False
+        low, high = totals.win_rate_interval(self.z)
+        score_low, score_high = totals.score_diff_interval(self.z)
+        return (high - low) / 2 <= self.win_rate_width and (score_high - score_low) / 2 <= self.score_width
@@ -0,0 +1,135 @@
+import random
+
+from AzulRules import TILES_PER_COLOR
+
+# Largest supported game: 5 players, so 11 factories plus the center
+MAX_PLAYERS = 5
+MAX_SOURCES = MAX_PLAYERS * 2 + 2
+NUM_COLORS = 5
+NUM_LINES = 5
+MAX_TILES = TILES_PER_COLOR  # a color never has more tiles in one place than in the game
+MAX_SCORE = 511  # well above the highest score the rules allow
+
+# Seeding Random with a string hashes it, so the keys are the same in every
+# process and every run, and hashes can be compared across games
+_rng = random.Random("azul zobrist keys")
+
+
+def _keys(count):
+    # Key 0 stands for an empty slot, so a fresh game hashes to 0 before the
+    # factories are filled and empty slots never need to be hashed
+    return [0] + [_rng.getrandbits(64) for _ in range(count)]
+
+
+# SOURCE_KEYS[source][color][count] for the factories and the center
+SOURCE_KEYS = [[_keys(MAX_TILES) for _ in range(NUM_COLORS)] for _ in range(MAX_SOURCES)]
+CENTER_TOKEN_KEY = _rng.getrandbits(64)
+# PATTERN_KEYS[player][line][color][count]
+PATTERN_KEYS = [[[_keys(line + 1) for _ in range(NUM_COLORS)] for line in range(NUM_LINES)] for _ in range(MAX_PLAYERS)]
+# WALL_KEYS[player][cell][color], the color matters in free mode
+WALL_KEYS = [[[_rng.getrandbits(64) for _ in range(NUM_COLORS)] for _ in range(NUM_LINES * 5)] for _ in range(MAX_PLAYERS)]
+# FLOOR_KEYS[player][color][count]
+FLOOR_KEYS = [[_keys(MAX_TILES) for _ in range(NUM_COLORS)] for _ in range(MAX_PLAYERS)]
+FLOOR_TOKEN_KEYS = [_rng.getrandbits(64) for _ in range(MAX_PLAYERS)]
+SCORE_KEYS = [_keys(MAX_SCORE) for _ in range(MAX_PLAYERS)]
+ACTIVE_PLAYER_KEYS = [_rng.getrandbits(64) for _ in range(MAX_PLAYERS)]
+FIRST_PLAYER_KEYS = [_rng.getrandbits(64) for _ in range(MAX_PLAYERS)]
+
+
+def full_hash(game):
+    # Reference computation by scanning the whole state. AzulGame keeps the
+    # same value up to date incrementally, this is only for checking it.
+    h = 0
+    for source in game.sources:
+        for color, count in enumerate(source.counts):
+            h ^= SOURCE_KEYS[source.index][color][count]
+    if game.center.first_player_token:
+        h ^= CENTER_TOKEN_KEY
+
+    for player in game.players:
+        p = player.index
+        for line, count in enumerate(player.pattern_counts):
+            if count:
+                h ^= PATTERN_KEYS[p][line][player.pattern_colors[line]][count]
+        for color, mask in enumerate(player.color_masks):
+            for cell in range(NUM_LINES * 5):
+                if mask >> cell & 1:
+                    h ^= WALL_KEYS[p][cell][color]
+        for color, count in enumerate(player.floor_counts):
+            h ^= FLOOR_KEYS[p][color][count]
+        if player.floor_token:
+            h ^= FLOOR_TOKEN_KEYS[p]
+        h ^= SCORE_KEYS[p][player.score]
+
+    return h ^ ACTIVE_PLAYER_KEYS[game.active_player] ^ FIRST_PLAYER_KEYS[game.first_player_token]
+
+
+class HashCheck:
+    """Checks the incremental hash against full_hash after every state change.
+
+    enable() wraps the AzulGame methods that update the hash so each call
+    ends with game.state_hash() == full_hash(game), raising AssertionError
+    otherwise, and disable() puts the originals back. Wall tiling is checked
+    after every pattern line and the floor, the steps of move_to_wall that
+    the game loop runs.
+    """
+
+    METHODS = ("apply_move", "undo_move", "tile_line", "clear_floor", "reset_factories")
+
+    def __init__(self):
+        self.checks = 0
+        self.originals = []
+
+    def enable(self):
+        from AzulGame import AzulGame  # AzulGame imports this module
+
+        for name in self.METHODS:
+            original = AzulGame.__dict__[name]
+            self.originals.append((AzulGame, name, original))
+            setattr(AzulGame, name, self.checked(name, original))
+
+    def disable(self):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+
+    def checked(self, name, function):
+        def wrapper(game, *args, **kwargs):
+            result = function(game, *args, **kwargs)
+            self.checks += 1
+            if game.state_hash() != full_hash(game):
+                raise AssertionError(f"Hash out of date after {name} in round {game.round_num}")
+            return result
+        wrapper.__name__ = name
+        return wrapper
+
+
+def check_games(games, seed=0):
+    # Plays seeded games in both modes with 2 to 4 players, CPUs that search
+    # with apply_move/undo_move among them, and checks the hash throughout.
+    # Returns the number of checks made.
+    from AzulCPU import AzulCPU
+    from AzulGame import AzulGame
+
+    algorithms = [("strategic", {}), ("alphabeta", {"max_nodes": 200}), ("mcts", {"playouts": 50})]
+    check = HashCheck()
+    check.enable()
+    try:
+        for i in range(games):
+            game = AzulGame(2 + i % 3, mode=("pattern", "free")[i // 3 % 2], verbose=False, seed=seed + i)
+            seats = [algorithms[(i + p) % len(algorithms)] for p in range(len(game.players))]
+            game.ai = [AzulCPU(game, algorithm, **options) for algorithm, options in seats]
+            game.play_game()
+    finally:
+        check.disable()
+    return check.checks
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the incremental Zobrist hash against a full recomputation")
+    parser.add_argument("--games", type=int, default=12, help="games to play")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"{check_games(args.games, args.seed)} hashes checked")
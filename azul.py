@@ -1,78 +1,284 @@
-
-import json
+import argparse
 import os
-import sys
+import random
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import zip_longest
 
+import numpy as np
 from tqdm import tqdm
 
+from AzulBatch import POLICIES, AzulBatch
 from AzulCPU import AzulCPU
 from AzulGame import AzulGame
+from AzulProfile import Profiler, format_summary, merge_summaries
+from AzulRecord import keep_records, record_game, write_records
+from AzulResults import ResultsStore, merge_results
+from AzulSearch import MOVE_TIME
+from AzulStopping import SPRT, ConfidenceWidth, MatchupTotals
 
-# Run the game
-mode = sys.argv[1]
 strategies = ["dummy", "greedy", "smart", "strategic"]
+search_strategies = ["alphabeta", "mcts", "ismcts"]
+# Difficulty levels of play, the last ones search on every core
+levels = strategies + ["mcts", "ismcts"]
+
 
-if mode == "play":
+def play():
     num_players = 0
     while num_players < 2 or num_players > 5:
         num_players = int(input("Please introduce the number of players (2-5): "))
-    
+
     mode = ''
     while mode not in ["pattern", "free"]:
         mode = input("Please select gamemode (pattern or free): ")
-    
+
     difficulty = 0
-    while difficulty < 1 or difficulty > 4:
-        difficulty = int(input("Please introduce the difficulty level (1-4): "))
-
-    game = AzulGame(num_players, mode=mode)
-    game.ai = [None] + [AzulCPU(game, strategies[difficulty - 1]) for _ in range(num_players - 1)]
-    game.play_game()
-
-elif mode == "simulate":
-    total_games = 100000
-
-    for first_strategy in strategies:
-        for second_strategy in strategies:
-            print(first_strategy, second_strategy)
-
-            results = [0, 0, 0]
-            total_scores = [0, 0]
-
-            for _ in tqdm(range(total_games)):
-                game = AzulGame(2, mode='pattern', verbose=False)
-                game.ai = [AzulCPU(game, first_strategy), AzulCPU(game, second_strategy)]
-                players = game.play_game()
-
-                total_scores[0] += players[0].score
-                total_scores[1] += players[1].score
-
-                if players[0].score > players[1].score:
-                    results[0] += 1
-                elif players[1].score > players[0].score:
-                    results[1] += 1
-                else:
-                    results[2] += 1
-            
-            if os.path.exists("results.json"):
-                with open("results.json", 'r') as f:
-                    data = json.load(f)
+    while difficulty < 1 or difficulty > len(levels):
+        difficulty = int(input(f"Please introduce the difficulty level (1-{len(levels)}): "))
+    algorithm = levels[difficulty - 1]
+
+    # One pool for the whole session, shared by all CPU players
+    workers = os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if algorithm in search_strategies else None
+    try:
+        game = AzulGame(num_players, mode=mode)
+        game.ai = [None] + [
+            AzulCPU(game, algorithm, max_time=MOVE_TIME, pool=pool, workers=workers)
+            for _ in range(num_players - 1)
+        ]
+        game.play_game()
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+def game_seed(seed, first_strategy, second_strategy, game_index):
+    # Seeding Random with a string hashes it with SHA-512, so every game gets
+    # an independent stream that is stable across processes and runs
+    return random.Random(f"{seed}:{first_strategy}:{second_strategy}:{game_index}").getrandbits(64)
+
+
+def play_chunk(chunk, profile=False, record=False):
+    # Plays a chunk of games and returns only the aggregated results, so
+    # workers send back a handful of numbers instead of game objects. The
+    # last item holds the optional extras: profiler stats and game records.
+    first_strategy, second_strategy, mode, seed, start, num_games = chunk
+
+    # The profiler patches the classes of this process only while the chunk runs
+    profiler = Profiler() if profile else None
+    if profiler:
+        profiler.enable()
+
+    results = [0, 0, 0]
+    total_scores = [0, 0]
+    diff_sq = 0
+    records = []
+
+    try:
+        for game_index in range(start, start + num_games):
+            seed_of_game = game_seed(seed, first_strategy, second_strategy, game_index)
+            game = AzulGame(2, mode=mode, verbose=False, seed=seed_of_game)
+            game.ai = [AzulCPU(game, first_strategy, seed=seed_of_game), AzulCPU(game, second_strategy, seed=seed_of_game + 1)]
+            if record:
+                records.append(record_game(game, seed_of_game))
+            players = game.play_game()
+
+            total_scores[0] += players[0].score
+            total_scores[1] += players[1].score
+            diff_sq += (players[0].score - players[1].score) ** 2
+
+            if players[0].score > players[1].score:
+                results[0] += 1
+            elif players[1].score > players[0].score:
+                results[1] += 1
             else:
-                data = {}
-
-            if first_strategy not in data:
-                data[first_strategy] = {}
-            
-            if second_strategy not in data[first_strategy]:
-                data[first_strategy][second_strategy] = {}
-
-            data[first_strategy][second_strategy] = {
-                "wins": results[0],
-                "losses": results[1],
-                "ties": results[2],
-                "avg_first": total_scores[0] / total_games,
-                "avg_second": total_scores[1] / total_games,
-            }
-
-            with open("results.json", 'w') as f:
-                json.dump(data, f, indent=4)
+                results[2] += 1
+    finally:
+        if profiler:
+            profiler.disable()
+
+    extras = {}
+    if profiler:
+        extras["profile"] = profiler.summary()
+    if record:
+        extras["records"] = records
+    return results, total_scores, diff_sq, extras
+
+
+def play_batch_chunk(chunk, profile=False, record=False):
+    # Plays a whole chunk in lockstep on the NumPy engine. Its random
+    # stream is per chunk, so results depend on the chunk size. Profiling
+    # and game records are only available on the object engine.
+    first_strategy, second_strategy, mode, seed, start, num_games = chunk
+
+    batch = AzulBatch(num_games, 2, (first_strategy, second_strategy), seed=game_seed(seed, first_strategy, second_strategy, start))
+    scores = batch.play_games()
+
+    results = [int((scores[:, 0] > scores[:, 1]).sum()), int((scores[:, 1] > scores[:, 0]).sum()), int((scores[:, 0] == scores[:, 1]).sum())]
+    total_scores = [int(scores[:, 0].sum()), int(scores[:, 1].sum())]
+    diff_sq = int(((scores[:, 0] - scores[:, 1]).astype(np.int64) ** 2).sum())
+    return results, total_scores, diff_sq, {}
+
+
+def recorded_seeds(chunk_keys):
+    # Seeds of the games in these store keys that --record writes, those of object engine chunks
+    return (
+        game_seed(seed, first_strategy, second_strategy, game_index)
+        for first_strategy, second_strategy, mode, seed, start, num_games, engine in chunk_keys if engine == 'object'
+        for game_index in range(start, start + num_games)
+    )
+
+
+def make_chunks(first_strategy, second_strategy, mode, total_games, chunk_size, seed):
+    # Every game derives its own seed from its index, so results do not
+    # depend on the chunk size or the worker count
+    return [
+        (first_strategy, second_strategy, mode, seed, start, min(chunk_size, total_games - start))
+        for start in range(0, total_games, chunk_size)
+    ]
+
+
+RUNNERS = {"object": play_chunk, "batch": play_batch_chunk}
+
+
+def simulate(total_games, workers, chunk_size, seed, engine='object', store_path='results.jsonl', resume=False, stopping=None,
+             mode='pattern', results_path='results.json', profile=False, record_path=None, algorithms=None):
+    algorithms = algorithms or strategies
+    matchups = [(first_strategy, second_strategy) for first_strategy in algorithms for second_strategy in algorithms]
+
+    tasks = {}
+    for first_strategy, second_strategy in matchups:
+        # The batch engine only knows pattern mode and the vectorized strategies, other matchups stay on the object engine
+        vectorized = mode == 'pattern' and first_strategy in POLICIES and second_strategy in POLICIES
+        chunk_engine = 'batch' if engine == 'batch' and vectorized else 'object'
+        tasks[first_strategy, second_strategy] = [
+            (chunk_engine, chunk) for chunk in make_chunks(first_strategy, second_strategy, mode, total_games, chunk_size, seed)
+        ]
+
+    # Finished chunks are logged as they complete, and a resumed run skips them
+    store = ResultsStore(store_path, resume=resume)
+    # Game records of object engine chunks, appended per chunk like the store.
+    # A chunk's records are written before it is logged, so on resume the
+    # file can hold records of a chunk that is not in the store and is about
+    # to be played again; only those of logged chunks are kept.
+    record = record_path is not None
+    if record and resume and os.path.exists(record_path):
+        keep_records(record_path, recorded_seeds(store.records))
+    record_file = open(record_path, 'ab' if resume else 'wb') if record else None
+
+    # A matchup is judged on the unbroken prefix of its chunks that have
+    # finished, so where it stops does not depend on the worker count
+    totals = {matchup: MatchupTotals() for matchup in matchups}
+    prefix = {matchup: 0 for matchup in matchups}
+    decided = set()
+    profiles = {matchup: [] for matchup in matchups}
+
+    def advance(matchup):
+        matchup_tasks = tasks[matchup]
+        while matchup not in decided and prefix[matchup] < len(matchup_tasks):
+            chunk_engine, chunk = matchup_tasks[prefix[matchup]]
+            if chunk + (chunk_engine,) not in store:
+                break
+            totals[matchup].add(store.records[chunk + (chunk_engine,)])
+            prefix[matchup] += 1
+            if prefix[matchup] == len(matchup_tasks) or (stopping and stopping.decided(totals[matchup])):
+                decided.add(matchup)
+
+    # Chunks are interleaved across matchups so every matchup can stop early
+    queue = deque(task for round_tasks in zip_longest(*tasks.values()) for task in round_tasks if task)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with tqdm(total=len(matchups) * total_games) as progress:
+            def finish(chunk_engine, chunk, outcome=None):
+                if outcome:
+                    results, total_scores, diff_sq, extras = outcome
+                    if "records" in extras:
+                        write_records(record_file, extras["records"])
+                        record_file.flush()
+                    store.append(*chunk, chunk_engine, results, total_scores, diff_sq)
+                    if "profile" in extras:
+                        profiles[chunk[:2]].append(extras["profile"])
+                advance(chunk[:2])
+                progress.update(chunk[5])
+
+            running = {}
+            while queue or running:
+                while queue and len(running) < 2 * workers:
+                    chunk_engine, chunk = queue.popleft()
+                    if chunk[:2] in decided:
+                        continue
+                    if chunk + (chunk_engine,) in store:
+                        finish(chunk_engine, chunk)
+                    elif executor:
+                        running[executor.submit(RUNNERS[chunk_engine], chunk, profile, record)] = (chunk_engine, chunk)
+                    else:
+                        finish(chunk_engine, chunk, RUNNERS[chunk_engine](chunk, profile, record))
+
+                if running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish(*running.pop(future), future.result())
+    finally:
+        store.close()
+        if record_file:
+            record_file.close()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    merged = [chunk + (chunk_engine,) for matchup in matchups for chunk_engine, chunk in tasks[matchup][:prefix[matchup]]]
+    reports = {matchup: stopping.report(totals[matchup]) for matchup in matchups} if stopping else {}
+    merge_results([store.records[key] for key in merged], results_path, reports)
+    # Chunks that finished after their matchup was decided are left out of the results, and of the records
+    if record and stopping:
+        keep_records(record_path, recorded_seeds(merged))
+
+    # Only chunks played in this run are profiled, not those skipped on resume
+    for first_strategy, second_strategy in matchups:
+        if profiles[first_strategy, second_strategy]:
+            print(f"{first_strategy} vs {second_strategy}")
+            print(format_summary(merge_summaries(profiles[first_strategy, second_strategy])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play Azul against the CPU or simulate CPU self-play")
+    parser.add_argument("command", choices=["play", "simulate"])
+    parser.add_argument("--mode", choices=["pattern", "free"], default="pattern", help="game mode for simulate")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used by simulate")
+    parser.add_argument("--games", type=int, default=100000, help="games per matchup in simulate")
+    parser.add_argument("--chunk-size", type=int, help="games per work unit in simulate, 1000 by default or 100 with --stop")
+    parser.add_argument("--seed", type=int, default=0, help="master seed for simulate")
+    parser.add_argument("--engine", choices=["object", "batch"], default="object",
+                        help="run dummy and greedy matchups on the vectorized NumPy engine")
+    parser.add_argument("--results", help="simulate output, results.json or results_free.json by default")
+    parser.add_argument("--store", help="log of finished simulate chunks, results.jsonl or results_free.jsonl by default")
+    parser.add_argument("--resume", action="store_true", help="skip chunks already recorded in the store")
+    parser.add_argument("--stop", choices=["none", "sprt", "ci"], default="none",
+                        help="stop a matchup early once it is statistically decided")
+    parser.add_argument("--alpha", type=float, default=0.05, help="error rate of the stopping rule and its intervals")
+    parser.add_argument("--sprt-delta", type=float, default=0.02, help="SPRT indifference zone around a 50%% win rate")
+    parser.add_argument("--ci-width", type=float, default=0.01, help="target half-width of the win rate interval")
+    parser.add_argument("--score-width", type=float, default=0.5, help="target half-width of the score difference interval")
+    parser.add_argument("--strategies", nargs="+", choices=strategies + search_strategies, default=strategies,
+                        help="CPU strategies whose matchups simulate plays")
+    parser.add_argument("--record", help="file to append a compact record of every object engine game to, for replays")
+    parser.add_argument("--profile", action="store_true", help="time the engine phases of object engine chunks and print them per matchup")
+    args = parser.parse_args()
+
+    stopping = None
+    if args.stop == "sprt":
+        stopping = SPRT(args.sprt_delta, args.alpha, args.alpha)
+    elif args.stop == "ci":
+        stopping = ConfidenceWidth(args.ci_width, args.score_width, args.alpha)
+
+    # Run the game
+    if args.command == "play":
+        play()
+    elif args.command == "simulate":
+        suffix = "" if args.mode == "pattern" else "_" + args.mode
+        results_path = args.results or f"results{suffix}.json"
+        store_path = args.store or f"results{suffix}.jsonl"
+        # A stopping rule only judges a matchup between chunks, so smaller ones let it stop sooner
+        chunk_size = args.chunk_size or (100 if stopping else 1000)
+        simulate(args.games, args.workers, chunk_size, args.seed, args.engine, store_path, args.resume, stopping,
+                 args.mode, results_path, args.profile, args.record, args.strategies)